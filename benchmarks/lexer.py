@@ -0,0 +1,102 @@
+"""
+Compares UrtextBuffer._lex against the previous per-symbol lexer
+over every file in the base and starter projects, then times both.
+
+    python benchmarks/lexer.py [repetitions]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from urtext.buffer import UrtextBuffer
+from urtext.utils import strip_backtick_escape, get_id_from_link
+import urtext.syntax as syntax
+
+PROJECT_FOLDERS = [
+    os.path.join(os.path.dirname(syntax.__file__), 'base_project'),
+    os.path.join(os.path.dirname(syntax.__file__), 'starter_project'),
+]
+
+def legacy_lex(contents, start_position=0):
+    """ the lexer as it was before the single-pass rewrite """
+    symbols = {}
+    meta_to_node = []
+    embedded_syntaxes = []
+    ranges, contents = strip_backtick_escape(contents)
+
+    for match in syntax.embedded_syntax_c.finditer(contents):
+        embedded_syntaxes.append([match.start(), match.end()])
+    for symbol, symbol_type in syntax.compiled_symbols.items():
+        for match in symbol.finditer(contents):
+            is_embedded = False
+            for r in embedded_syntaxes:
+                if match.start() in range(r[0], r[1]):
+                    is_embedded = True
+                    break
+            if is_embedded:
+                continue
+            if symbol_type == 'meta_to_node':
+                meta_to_node.append(match)
+                continue
+            symbols[match.start() + start_position] = {}
+            symbols[match.start() + start_position]['type'] = symbol_type
+
+            if symbol_type == 'pointer':
+                symbols[match.start() + start_position]['contents'] = get_id_from_link(match.group())
+
+    symbols[len(contents) + start_position] = { 'type': 'EOB' }
+    return symbols, meta_to_node
+
+class LexOnlyBuffer(UrtextBuffer):
+    """ buffer that skips parsing, so _lex() can be called directly """
+    def __init__(self):
+        self.meta_to_node = []
+
+def current_lex(contents):
+    buffer = LexOnlyBuffer()
+    symbols = buffer._lex(contents)
+    return symbols, buffer.meta_to_node
+
+def read_project_files():
+    contents = {}
+    for folder in PROJECT_FOLDERS:
+        for f in sorted(os.listdir(folder)):
+            if os.path.splitext(f)[1] != '.urtext':
+                continue
+            with open(os.path.join(folder, f), 'r', encoding='utf-8') as the_file:
+                contents[os.path.join(os.path.basename(folder), f)] = the_file.read()
+    return contents
+
+def compare(all_contents):
+    mismatches = []
+    for filename, contents in all_contents.items():
+        legacy_symbols, legacy_meta = legacy_lex(contents)
+        symbols, meta = current_lex(contents)
+        if sorted(legacy_symbols.items()) != sorted(symbols.items()) or (
+            [(m.span(), m.group()) for m in legacy_meta] != [(m.span(), m.group()) for m in meta]):
+            mismatches.append(filename)
+    return mismatches
+
+def main(repetitions=20):
+    all_contents = read_project_files()
+    mismatches = compare(all_contents)
+    print('%d files compared, %d mismatches' % (len(all_contents), len(mismatches)))
+    for filename in mismatches:
+        print('  mismatch: %s' % filename)
+
+    def run(lexer):
+        for contents in all_contents.values():
+            lexer(contents)
+
+    legacy_time = timeit.timeit(lambda: run(legacy_lex), number=repetitions)
+    current_time = timeit.timeit(lambda: run(current_lex), number=repetitions)
+    print('legacy lexer:  %.4fs' % legacy_time)
+    print('current lexer: %.4fs' % current_time)
+    print('speedup:       %.2fx' % (legacy_time / current_time))
+    return not mismatches
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    sys.exit(0 if main(repetitions) else 1)
@@ -0,0 +1,71 @@
+"""
+Loads a generated project under tracemalloc and prints the memory
+the loaded projects hold, in total and per node.
+
+    python benchmarks/memory.py [files]
+"""
+import os
+import sys
+import gc
+import random
+import shutil
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from urtext.project_list import ProjectList
+import urtext.syntax as syntax
+
+BASE_PROJECT = os.path.join(os.path.dirname(syntax.__file__), 'base_project')
+WORDS = 'alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu'.split()
+
+def write_project(folder, files):
+    """ files of a titled root node with metadata and five nested nodes """
+    random.seed(1)
+    for i in range(files):
+        body = [
+            'File %d _' % i,
+            'tags::%s; index::%d' % (random.choice(WORDS), i),
+            '<Mon., Jan. 0%d, 2024, 10:00 AM UTC>' % (i % 9 + 1)]
+        for j in range(5):
+            body.append('{ Node %d-%d _ #%s some text | File %d > kind::%s\n%s }' % (
+                i, j,
+                random.choice(WORDS),
+                random.randint(0, files - 1),
+                random.choice(WORDS),
+                ' '.join(random.choice(WORDS) for _ in range(80))))
+        with open(os.path.join(folder, 'f%d.urtext' % i), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(body))
+
+def main(files=500):
+    folder = tempfile.mkdtemp()
+    try:
+        entry_point = os.path.join(folder, 'project')
+        base_project = os.path.join(folder, 'base_project')
+        os.makedirs(entry_point)
+        write_project(entry_point, files)
+        shutil.copytree(BASE_PROJECT, base_project)
+
+        gc.collect()
+        tracemalloc.start()
+        project_list = ProjectList(
+            entry_point,
+            is_async=False,
+            base_project_path=base_project,
+            editor_methods={ 'get_open_files': lambda: {} })
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    nodes = sum(len(p.nodes) for p in project_list.projects)
+    print('%d files, %d nodes' % (files, nodes))
+    print('current: %.1fMB' % (current / 1e6))
+    print('peak:    %.1fMB' % (peak / 1e6))
+    print('per node: %d bytes' % (current / nodes))
+
+if __name__ == '__main__':
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    main(files)
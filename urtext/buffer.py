@@ -1,6 +1,8 @@
 import re
+import bisect
+import collections
 from urtext.node import UrtextNode
-from urtext.utils import strip_backtick_escape, get_id_from_link
+from urtext.utils import strip_backtick_escape, get_id_from_link, get_edited_range
 import urtext.syntax as syntax
 
 class UrtextBuffer:
@@ -12,17 +14,22 @@ class UrtextBuffer:
         self.project = project
         self.identifier = None
         self.meta_to_node = []
+        self.symbols = {}
         self.filename = filename
         self.nodes = []
         self.root_node = None
+        self.position_index = None
+        self.batched_edits = None
         self._lex_and_parse()
         
     def _lex_and_parse(self):
         self.nodes = []
         self.root_node = None
         self.meta_to_node = []
+        self.position_index = None
         contents = self._get_contents()
         symbols = self._lex(contents)
+        self.symbols = symbols
         self._parse(contents, symbols)
         for node in self.nodes:
             node.buffer = self
@@ -33,35 +40,65 @@ class UrtextBuffer:
         self.resolve_nodes()
 
     def _lex(self, contents, start_position=0):
+        """
+        Single pass over the characters that can begin a symbol,
+        emitting symbols in position order. Embedded syntax spans are
+        sorted and non-overlapping, so membership is a bisect.
+        """
         symbols = {}
-        embedded_syntaxes = []
         ranges, contents = strip_backtick_escape(contents)
 
+        embedded_starts = []
+        embedded_ends = []
         for match in syntax.embedded_syntax_c.finditer(contents):
-            embedded_syntaxes.append([match.start(), match.end()])
-        for symbol, symbol_type in syntax.compiled_symbols.items():
-            for match in symbol.finditer(contents):
-                is_embedded = False
-                for r in embedded_syntaxes:
-                    if match.start() in range(r[0], r[1]):
-                        is_embedded = True
-                        break
-                if is_embedded:
-                    continue
-                if symbol_type == 'meta_to_node':
-                    self.meta_to_node.append(match)
-                    continue
-                symbols[match.start() + start_position] = {}
-                symbols[match.start() + start_position]['type'] = symbol_type
-
-                if symbol_type == 'pointer':
-                    symbols[match.start() + start_position]['contents'] = get_id_from_link(match.group())
+            embedded_starts.append(match.start())
+            embedded_ends.append(match.end())
+
+        def is_embedded(position):
+            index = bisect.bisect_right(embedded_starts, position) - 1
+            return index > -1 and position < embedded_ends[index]
+
+        for match in syntax.lexer_symbols_c.finditer(contents):
+            position = match.start()
+            if is_embedded(position):
+                continue
+            character = match.group()
+
+            if character == syntax.link_opening_pipe:
+                pointer = syntax.node_pointer_c.match(contents, position)
+                if pointer:
+                    symbols[position + start_position] = {
+                        'type': 'pointer',
+                        'contents': get_id_from_link(pointer.group())
+                    }
+                continue
+
+            if position and contents[position - 1] == '\\':
+                continue
+
+            if character == syntax.node_closing_wrapper:
+                symbols[position + start_position] = { 'type': 'closing_wrapper' }
+                continue
+
+            symbols[position + start_position] = { 'type': 'opening_wrapper' }
+            key_end = position - len(syntax.metadata_assigner)
+            if key_end > 0 and contents[key_end:position] == syntax.metadata_assigner:
+                key_start = key_end
+                while key_start and syntax.word_character_c.match(contents, key_start - 1):
+                    key_start -= 1
+                if key_start < key_end and not is_embedded(key_start):
+                    self.meta_to_node.append(
+                        syntax.meta_to_node_c.match(contents, key_start))
 
         symbols[len(contents) + start_position] = { 'type': 'EOB' }
         return symbols
 
-    def _parse(self, contents, symbols, nested_levels={}, nested=0, child_group={}, start_position=0):
+    def _parse(self, contents, symbols, nested_levels=None, nested=0, child_group=None, start_position=0):
  
+        if nested_levels is None:
+            nested_levels = {}
+        if child_group is None:
+            child_group = {}
         ranges, unstripped_contents = strip_backtick_escape(contents)
         last_position = start_position
         pointers = {}
@@ -175,11 +212,12 @@ class UrtextBuffer:
 
     def add_node(self, ranges, nested, contents, root=None, start_position=0):
 
-        # Build the node contents and construct the node
-        node_contents = ''.join([
-            contents[r[0] - start_position:r[1] - start_position ] for r in ranges])
-
-        new_node = self.urtext_node(node_contents, self.project, root=root, nested=nested)
+        new_node = self.urtext_node(
+            contents,
+            self.project,
+            root=root,
+            nested=nested,
+            source_ranges=[(r[0] - start_position, r[1] - start_position) for r in ranges])
         new_node.ranges = ranges
         new_node.start_position = ranges[0][0]
         new_node.end_position = ranges[-1][1]
@@ -196,9 +234,305 @@ class UrtextBuffer:
         return self.contents
 
     def set_buffer_contents(self, new_contents):
+        if new_contents == self.contents and self.root_node:
+            return
         self.contents = new_contents
         self._lex_and_parse()
 
+    def replace_node_contents(self, node, new_contents):
+        if self.batched_edits is not None and any(n is node for n in self.nodes):
+            self.batched_edits.append((node.start_position, node.end_position, new_contents, node))
+            return
+        if self._splice_nodes([(node, new_contents)]):
+            return
+        buffer_contents = self._get_contents()
+        self.set_buffer_contents(''.join([
+            buffer_contents[:node.start_position],
+            new_contents,
+            buffer_contents[node.end_position:]]))
+
+    def begin_batch(self):
+        """
+        Until end_batch(), contents set on this buffer's nodes are
+        queued, then applied together with a single parse.
+        """
+        if self.batched_edits is None:
+            self.batched_edits = []
+
+    def end_batch(self):
+        self.apply_batched_edits()
+        self.batched_edits = None
+
+    def overlaps_batched_edit(self, node):
+        """ if so, queued edits must be applied before editing node """
+        for start, end, _contents, _node in self.batched_edits or []:
+            if (start, end) == (node.start_position, node.end_position):
+                return True
+            if start < node.end_position and node.start_position < end:
+                return True
+        return False
+
+    def apply_batched_edits(self):
+        if not self.batched_edits:
+            return
+        edits = sorted(self.batched_edits, key=lambda e: e[0])
+        self.batched_edits = None
+        if not self._splice_nodes([(node, new_contents) for _s, _e, new_contents, node in edits]):
+            buffer_contents = self._get_contents()
+            for start, end, new_contents, _node in reversed(edits):
+                buffer_contents = ''.join([
+                    buffer_contents[:start],
+                    new_contents,
+                    buffer_contents[end:]])
+            self.set_buffer_contents(buffer_contents)
+        self.batched_edits = []
+
+    def _splice_nodes(self, edits):
+        """
+        Replaces the contents of nodes without child nodes, given as
+        (node, new contents) in position order, lexing and parsing only
+        the new contents and shifting the positions between and after
+        them. Returns False if the buffer needs a full parse instead:
+        the buffer's nodes are still the project's, which keep the
+        positions they were parsed with, the new contents add wrappers
+        or preformatted or embedded syntax, an edited node would change
+        its ID, or two edited nodes share a line, so a pointer could
+        run from one into the other.
+        """
+        if not self.root_node or not edits or self._get_contents() != self.contents:
+            return False
+        if self.project.nodes.get(self.root_node.id) is self.root_node:
+            return False
+        contents = self.contents
+        node_ids = set(id(n) for n in self.nodes)
+        spans = []
+        for node, new_contents in edits:
+            if node.is_root_node or node.is_meta or node.children or len(node.ranges) != 1:
+                return False
+            if id(node) not in node_ids or not new_contents:
+                return False
+            start, end = node.start_position, node.end_position
+            for text in [contents[start:end], new_contents]:
+                if '`' in text or '%%' in text:
+                    return False
+            if new_contents[-1] == '\\':
+                # would escape the closing wrapper
+                return False
+            line_start = contents.rfind('\n', 0, start) + 1
+            line_end = contents.find('\n', end)
+            if line_end == -1:
+                line_end = len(contents)
+            if syntax.link_opening_pipe in contents[line_start:start]:
+                # a pointer before the node could extend into it
+                return False
+            if spans and spans[-1][2] >= line_start:
+                return False
+            spans.append((start, end, line_end))
+
+        ends = []
+        total_offsets = [0]
+        for (node, new_contents), (start, end, line_end) in zip(edits, spans):
+            ends.append(end)
+            total_offsets.append(total_offsets[-1] + len(new_contents) - (end - start))
+
+        def shift(position, is_range_start=False):
+            if is_range_start:
+                return position + total_offsets[bisect.bisect_left(ends, position)]
+            return position + total_offsets[bisect.bisect_right(ends, position)]
+
+        pieces = []
+        last_end = 0
+        for (node, new_contents), (start, end, line_end) in zip(edits, spans):
+            pieces.extend([contents[last_end:start], new_contents])
+            last_end = end
+        pieces.append(contents[last_end:])
+        new_buffer_contents = ''.join(pieces)
+
+        meta_to_node = self.meta_to_node
+        ids = collections.Counter(n.id for n in self.nodes)
+        titles = collections.Counter(n.title for n in self.nodes)
+        replacements = []
+        new_symbols = []
+        for (node, new_contents), (start, end, line_end) in zip(edits, spans):
+            new_start = shift(start, is_range_start=True)
+            new_end = new_start + len(new_contents)
+            # pointers can run past the node's end up to the next newline
+            self.meta_to_node = []
+            symbols = self._lex(
+                new_contents + contents[end:line_end],
+                start_position=new_start)
+            found_meta_to_node = self.meta_to_node
+            self.meta_to_node = meta_to_node
+            if found_meta_to_node or symbols.get(new_end) != { 'type': 'closing_wrapper' }:
+                return False
+            symbols = [(p, s) for p, s in symbols.items() if p < new_end]
+            if [s for p, s in symbols if s['type'] != 'pointer']:
+                return False
+            new_ranges = [[new_start, new_end]]
+            new_node = self._make_replacement_node(
+                node, new_contents, [[0, len(new_contents)]], ids=ids, titles=titles)
+            if not new_node:
+                return False
+            pointers = [{ 'id': s['contents'], 'position': p } for p, s in symbols]
+            replacements.append((node, new_node, new_ranges, pointers))
+            new_symbols.extend(symbols)
+
+        self._replace_nodes(replacements, shift)
+        starts = [span[0] for span in spans]
+        for position, symbol in self.symbols.items():
+            index = bisect.bisect_right(starts, position) - 1
+            if index < 0 or position >= spans[index][1]:
+                new_symbols.append((shift(position), symbol))
+        self.symbols = dict(sorted(new_symbols, key=lambda s: s[0]))
+        self.meta_to_node = [m if shift(m.start()) == m.start() else syntax.meta_to_node_c.match(
+            new_buffer_contents, shift(m.start())) for m in self.meta_to_node]
+        self.contents = new_buffer_contents
+        return True
+
+    def _parse_edit(self, new_contents):
+        """
+        Re-parses only the innermost node containing the edit between
+        the current and the new contents, shifting the ranges of the
+        nodes after it. Returns a list of (old node, new node) pairs,
+        empty if nothing changed, or None if a full parse is needed:
+        the wrapper structure or meta_to_node entries changed, the edit
+        spans more than one range, or the edited node changed its ID.
+        """
+        old_contents = self.contents
+        if old_contents is None or new_contents is None or not self.root_node:
+            return None
+        if old_contents == new_contents:
+            return []
+        start, old_end, new_end = get_edited_range(old_contents, new_contents)
+        if start == 0:
+            return None
+        offset = new_end - old_end
+
+        edited_node = None
+        edited_range = None
+        for node in self.nodes:
+            for r in node.ranges:
+                if r[0] <= start and old_end <= r[1]:
+                    if edited_node is None or node.nested > edited_node.nested:
+                        edited_node, edited_range = node, r
+        if not edited_node or edited_node.is_meta:
+            return None
+        for match in self.meta_to_node:
+            if edited_node.start_position <= match.start() <= edited_node.end_position:
+                return None
+
+        meta_to_node = self.meta_to_node
+        self.meta_to_node = []
+        symbols = self._lex(new_contents)
+        new_meta_to_node = self.meta_to_node
+        self.meta_to_node = meta_to_node
+
+        def shift(position, is_range_start=False):
+            if position > old_end or (position == old_end and not is_range_start):
+                return position + offset
+            return position
+
+        structure = [(shift(p), s['type']) for p, s in self.symbols.items() if s['type'] != 'pointer']
+        new_structure = [(p, s['type']) for p, s in symbols.items() if s['type'] != 'pointer']
+        if structure != new_structure:
+            return None
+        if [(shift(m.start()), m.group()) for m in self.meta_to_node] != [
+            (m.start(), m.group()) for m in new_meta_to_node]:
+            return None
+
+        new_ranges = [[shift(r[0], is_range_start=True), shift(r[1])] for r in edited_node.ranges]
+        if edited_range[0] == edited_range[1] + offset:
+            return None
+        contents = new_contents
+        if edited_node.is_root_node:
+            ranges, contents = strip_backtick_escape(new_contents)
+        new_node = self._make_replacement_node(edited_node, contents, new_ranges)
+        if not new_node:
+            return None
+        pointers = [{
+            'id': symbols[position]['contents'],
+            'position': position
+            } for position in sorted(symbols) if symbols[position]['type'] == 'pointer' and any(
+                r[0] <= position < r[1] for r in new_ranges)]
+        self._replace_nodes([(edited_node, new_node, new_ranges, pointers)], shift)
+        self.contents = new_contents
+        self.symbols = symbols
+        self.meta_to_node = new_meta_to_node
+        return [(edited_node, new_node)]
+
+    def _make_replacement_node(self, edited_node, contents, source_ranges, ids=None, titles=None):
+        """
+        Parses the node replacing edited_node from the source_ranges of
+        contents, or returns None if it would not keep the same ID.
+        ids and titles count those of the buffer's nodes.
+        """
+        new_node = self.urtext_node(
+            contents,
+            self.project,
+            root=edited_node.is_root_node,
+            nested=edited_node.nested,
+            source_ranges=source_ranges)
+        if new_node.title != edited_node.title or new_node.untitled:
+            return None
+        if edited_node.resolution:
+            # resolve_id() would get the same result from the same inputs
+            if timestamp_string(new_node) != timestamp_string(edited_node):
+                return None
+            new_node.resolution = edited_node.resolution
+            new_node.id = edited_node.id
+        if ids is None:
+            ids = collections.Counter(n.id for n in self.nodes)
+            titles = collections.Counter(n.title for n in self.nodes)
+        if ids[new_node.id] > (edited_node.id == new_node.id):
+            return None
+        if not new_node.resolution and titles[new_node.title] > 1:
+            # a full parse would resolve both
+            return None
+        return new_node
+
+    def _replace_nodes(self, replacements, shift):
+        """
+        Shifts the positions in the buffer's nodes and swaps in the
+        given (old node, new node, new ranges, pointers).
+        """
+        for node in self.nodes:
+            node.ranges = [[shift(r[0], is_range_start=True), shift(r[1])] for r in node.ranges]
+            node.start_position = node.ranges[0][0]
+            node.end_position = node.ranges[-1][1]
+            for pointer in node.pointers:
+                pointer['position'] = shift(pointer['position'])
+
+        replaced = {}
+        parents = {}
+        for edited_node, new_node, new_ranges, pointers in replacements:
+            new_node.ranges = new_ranges
+            new_node.start_position = new_ranges[0][0]
+            new_node.end_position = new_ranges[-1][1]
+            new_node.buffer = self
+            new_node.file = self
+            new_node.filename = self.filename
+            new_node.pointers = pointers
+            new_node.parent = edited_node.parent
+            new_node.children = edited_node.children
+            for child in new_node.children:
+                child.parent = new_node
+            if new_node.parent:
+                parents[id(new_node.parent)] = new_node.parent
+            for entry in edited_node.metadata.entries():
+                if entry.from_node not in [None, edited_node]:
+                    # tags from ancestors
+                    entry.node = new_node
+                    new_node.metadata.entries_dict.setdefault(entry.keyname, [])
+                    new_node.metadata.entries_dict[entry.keyname].append(entry)
+            if edited_node.is_root_node:
+                self.root_node = new_node
+            replaced[id(edited_node)] = new_node
+
+        for parent in parents.values():
+            parent.children = [replaced.get(id(c), c) for c in parent.children]
+        self.nodes = [replaced.get(id(n), n) for n in self.nodes]
+        self.position_index = None
+
     def write_buffer_contents(self, run_hook=None):
         self.project.run_editor_method(
             'set_buffer',
@@ -232,10 +566,32 @@ class UrtextBuffer:
             self._assign_parents(child)
 
     def get_node_from_position(self, position):
-        for node in self.nodes:
-            for r in node.ranges:       
-                if position in range(r[0],r[1]+1): # +1 in case the cursor is in the last position of the node.
-                    return node
+        """
+        Node ranges do not overlap, except that a range's end
+        is also the start of the next, so only the ranges just before
+        the position need checking. Where two ranges contain it,
+        the node earlier in self.nodes is returned.
+        """
+        if self.position_index is None:
+            self._build_position_index()
+        starts, ranges = self.position_index
+        found = None
+        index = bisect.bisect_right(starts, position) - 1
+        while index > -1:
+            start, end, node_index = ranges[index]
+            if end < position: # the end is included in case the cursor is in the last position of the node.
+                break
+            if found is None or node_index < found:
+                found = node_index
+            index -= 1
+        if found is not None:
+            return self.nodes[found]
+
+    def _build_position_index(self):
+        ranges = sorted(
+            (r[0], r[1], node_index)
+            for node_index, node in enumerate(self.nodes) for r in node.ranges)
+        self.position_index = ([r[0] for r in ranges], ranges)
 
     def node_ids(self):
         return [n.id for n in self.nodes]
@@ -244,3 +600,8 @@ class UrtextBuffer:
         for n in self.nodes:
             if n.id == node_id:
                 return n
+
+def timestamp_string(node):
+    timestamp = node.metadata.get_newest_timestamp()
+    if timestamp:
+        return timestamp.unwrapped_string
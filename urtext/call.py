@@ -17,6 +17,9 @@ class UrtextCall:
     project_instance = False
     project_list_instance = False
     is_manual = False
+    # True if the output depends only on project queries
+    # and included nodes, which are recorded as the frame runs
+    dependencies_recorded = False
     
     def __init__(self, project_or_project_list):
         self.keys_with_flags = []
@@ -0,0 +1,90 @@
+import re
+
+word_c = re.compile(r'\w+')
+
+class ContentsIndex:
+    """
+    Inverted index of the lowercased words in each node's stripped
+    contents, used to find candidates for `_contents ?` substring
+    queries, which are then verified against the lowercased contents
+    kept for each node.
+
+    The index is built the first time it is queried, so projects
+    that never search contents do not derive and keep every node's
+    text.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.words = {}
+        self.node_contents = {}
+
+    def add_node(self, node):
+        if not self.enabled:
+            return
+        self.remove_node(node)
+        contents = node.stripped_contents.lower()
+        for word in set(word_c.findall(contents)):
+            self.words.setdefault(word, set()).add(node)
+        self.node_contents[node] = contents
+
+    def remove_node(self, node):
+        contents = self.node_contents.pop(node, None)
+        if contents is None:
+            return
+        for word in set(word_c.findall(contents)):
+            nodes = self.words[word]
+            nodes.discard(node)
+            if not nodes:
+                del self.words[word]
+
+    def build(self, nodes):
+        self.enabled = True
+        for node in nodes:
+            self.add_node(node)
+
+    def search(self, value):
+        """ returns the indexed nodes whose contents contain value """
+        candidates = self.get_candidates(value)
+        if candidates is None:
+            candidates = self.node_contents
+        value = value.lower()
+        return [n for n in candidates if value in self.node_contents[n]]
+
+    def get_candidates(self, value):
+        """
+        Returns the nodes that could contain value, or None if
+        value has no words to look up.
+
+        Words inside value must be whole words in the contents.
+        The first and last may be the end or start of a longer word.
+        """
+        value = value.lower()
+        matches = list(word_c.finditer(value))
+        if not matches:
+            return None
+        candidates = None
+        for index, match in enumerate(matches):
+            fragment = match.group()
+            open_start = index == 0 and match.start() == 0
+            open_end = index == len(matches) - 1 and match.end() == len(value)
+            if not open_start and not open_end:
+                nodes = self.words.get(fragment, set())
+            else:
+                nodes = set()
+                for word in self.words:
+                    if open_start and open_end:
+                        found = fragment in word
+                    elif open_start:
+                        found = word.endswith(fragment)
+                    else:
+                        found = word.startswith(fragment)
+                    if found:
+                        nodes.update(self.words[word])
+            if candidates is None:
+                candidates = set(nodes)
+            else:
+                candidates.intersection_update(nodes)
+            if not candidates:
+                break
+        return candidates
@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+    IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+# a listing is trusted only if made this long after the directory's
+# mtime, since a change within the mtime's resolution would not show
+RACY_SECONDS = 2
+POLL_SECONDS = 1
+
+class UrtextFileWatcher:
+    """
+    Keeps the names of the files in a project's directories, listing
+    each directory once and then keeping it current from inotify
+    events where available. Otherwise the directories' mtimes are
+    polled, and a directory is listed again when its mtime changes.
+
+    Files added, removed, or (with inotify) written are queued for
+    take_events() once the writing is done: on inotify's close and
+    rename events, or when polling, once a new file's size and mtime
+    stay the same between polls. Files found when a directory is
+    listed again, as after inotify loses events, are queued the same
+    way. on_events is called, from the watcher's thread or from
+    list_files(), when the queue stops being empty.
+
+    stop() ends the watcher's thread and closes its inotify instance.
+    """
+
+    def __init__(self, on_events=None, use_inotify=True):
+        self.on_events = on_events
+        self.lock = threading.Lock()
+        self.listings = {}
+        self.events = {}
+        self.settling = {}
+        self.watches = {}
+        self.watched_directories = {}
+        self.inotify = None
+        self.inotify_fd = None
+        self.thread = None
+        self.stopped = threading.Event()
+        if use_inotify:
+            self._start_inotify()
+        if self.inotify_fd is None:
+            self.thread = threading.Thread(target=self._poll, daemon=True)
+            self.thread.start()
+
+    def list_files(self, paths):
+        """
+        Returns the files in each path, or in the directory of each
+        path that is a file, in os.listdir() order.
+        """
+        files = []
+        directories = []
+        for pathname in paths:
+            directory = pathname if os.path.isdir(pathname) else os.path.dirname(pathname)
+            directories.append(directory)
+            files.extend(os.path.join(directory, f) for f in self._get_listing(directory))
+        self._unwatch_other_directories(directories)
+        return files
+
+    def take_events(self):
+        """ returns the filenames changed since the last call, oldest first """
+        with self.lock:
+            events = self.events
+            self.events = {}
+        return list(events)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def _get_listing(self, directory, only_if_listed=False):
+        with self.lock:
+            listing = self.listings.get(directory)
+            if listing and listing['watched']:
+                return list(listing['names'])
+        watched = self._watch(directory)
+        status = os.stat(directory)
+        notify = False
+        # events read while listing are applied after it, so none is missed
+        with self.lock:
+            listing = self.listings.get(directory)
+            if listing is None and only_if_listed:
+                return []
+            if listing and listing['watched']:
+                return list(listing['names'])
+            if listing and not watched and status.st_mtime_ns == listing['mtime_ns'] and (
+                    listing['listed_at'] - status.st_mtime > RACY_SECONDS):
+                return list(listing['names'])
+            listed_at = time.time()
+            names = dict.fromkeys(os.listdir(directory))
+            if listing:
+                for name in names:
+                    if name not in listing['names']:
+                        self.settling[os.path.join(directory, name)] = None
+                for name in listing['names']:
+                    if name not in names:
+                        notify = self._add_event(directory, name) or notify
+            self.listings[directory] = {
+                'names': names,
+                'mtime_ns': status.st_mtime_ns,
+                'listed_at': listed_at,
+                'watched': watched,
+                }
+        if notify and self.on_events:
+            self.on_events()
+        return list(names)
+
+    def _add_event(self, directory, name):
+        """ call with the lock held; returns True if no events were queued """
+        was_empty = not self.events
+        filename = os.path.join(directory, name)
+        self.settling.pop(filename, None)
+        self.events.pop(filename, None)
+        self.events[filename] = None
+        return was_empty
+
+    def _start_inotify(self):
+        if not sys.platform.startswith('linux'):
+            return
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        except (OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        self.inotify = libc
+        self.inotify_fd = fd
+        self.thread = threading.Thread(target=self._read_events, daemon=True)
+        self.thread.start()
+
+    def _watch(self, directory):
+        """ returns True if inotify reports changes in the directory """
+        if self.inotify_fd is None:
+            return False
+        with self.lock:
+            if directory in self.watched_directories:
+                return True
+        wd = self.inotify.inotify_add_watch(
+            self.inotify_fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            # e.g. the limit on watches was reached
+            return False
+        with self.lock:
+            self.watches[wd] = directory
+            self.watched_directories[directory] = wd
+        return True
+
+    def _unwatch_other_directories(self, directories):
+        with self.lock:
+            removed = [d for d in self.listings if d not in directories]
+            for directory in removed:
+                del self.listings[directory]
+                wd = self.watched_directories.pop(directory, None)
+                if wd is not None:
+                    del self.watches[wd]
+                    self.inotify.inotify_rm_watch(self.inotify_fd, wd)
+
+    def _poll(self):
+        while not self.stopped.wait(POLL_SECONDS):
+            with self.lock:
+                directories = list(self.listings)
+            for directory in directories:
+                try:
+                    self._get_listing(directory, only_if_listed=True)
+                except OSError:
+                    pass
+            self._check_settling_files()
+
+    def _check_settling_files(self):
+        with self.lock:
+            settling = dict(self.settling)
+        notify = False
+        for filename, last_status in settling.items():
+            try:
+                status = os.stat(filename)
+                status = (status.st_size, status.st_mtime_ns)
+            except OSError:
+                status = None
+            with self.lock:
+                if status is None or status == last_status:
+                    self.settling.pop(filename, None)
+                    if status:
+                        directory, name = os.path.split(filename)
+                        notify = self._add_event(directory, name) or notify
+                elif filename in self.settling:
+                    self.settling[filename] = status
+        if notify and self.on_events:
+            self.on_events()
+
+    def _read_events(self):
+        settling_checked_at = time.time()
+        while not self.stopped.is_set():
+            if time.time() - settling_checked_at >= POLL_SECONDS:
+                self._check_settling_files()
+                settling_checked_at = time.time()
+            try:
+                ready, _w, _x = select.select([self.inotify_fd], [], [], 1)
+                if not ready:
+                    continue
+                data = os.read(self.inotify_fd, 65536)
+            except (OSError, ValueError):
+                return
+            notify = False
+            with self.lock:
+                offset = 0
+                while offset < len(data):
+                    wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                    offset += EVENT_HEADER.size
+                    name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                    offset += length
+                    notify = self._apply_event(wd, mask, name) or notify
+            if notify and self.on_events:
+                self.on_events()
+
+    def _apply_event(self, wd, mask, name):
+        """ call with the lock held; returns True if no events were queued """
+        if mask & IN_Q_OVERFLOW:
+            # events were lost; list every directory again
+            for listing in self.listings.values():
+                listing['watched'] = False
+                listing['mtime_ns'] = None
+            return False
+        directory = self.watches.get(wd)
+        if directory is None:
+            return False
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+            self.watches.pop(wd, None)
+            self.watched_directories.pop(directory, None)
+            listing = self.listings.get(directory)
+            if listing:
+                listing['watched'] = False
+                listing['mtime_ns'] = None
+            return False
+        listing = self.listings.get(directory)
+        if not listing or not listing['watched']:
+            return False
+        if mask & IN_CREATE:
+            # reported when written and closed
+            listing['names'][name] = None
+            return False
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            listing['names'].pop(name, None)
+        else:
+            listing['names'][name] = None
+        return self._add_event(directory, name)
@@ -50,6 +50,13 @@ class UrtextFrame:
                 return True
         return False
 
+    def dependencies_recorded(self):
+        """ whether the frame's output depends only on what the project records while it runs """
+        for op in self.operations:
+            if not op.dependencies_recorded:
+                return False
+        return True
+
     def preserve_title_if_present(self, target):
         if target.is_virtual and target.matching_string == '@self':
             source_node = self.project.get_node(self.source_node.id)
@@ -97,6 +104,7 @@ class UrtextFrame:
                     traceback.format_exc(),
                     '\n'
                 ]) + '`'
+            self._record_included_nodes()
             if transformed_text is False:  # not None
                 return ''
             if transformed_text is None:
@@ -113,6 +121,19 @@ class UrtextFrame:
             accumulated_text += '\n'.join(self.system_contents)
         return accumulated_text
 
+    def _record_included_nodes(self):
+        show = self.show
+        for placeholder in ['$title', '$_link', '$_pointer']:
+            show = show.replace(placeholder, '')
+        uses_contents = '$_contents' in show or '$_lines' in show
+        uses_metadata = '$' in show.replace('$_contents', '').replace('$_lines', '')
+        for node in self.included_nodes:
+            self.project.frame_dependencies.record_node(node.id)
+            if uses_metadata:
+                self.project.frame_dependencies.record_node_metadata(node.id)
+            if uses_contents:
+                self.project.frame_dependencies.record_node_contents(node.id)
+
     def default_output(self):
         for operation in list(reversed(self.operations)):
             if operation.should_continue() is False:
@@ -0,0 +1,178 @@
+import threading
+
+ALL_NODES = ('nodes',)
+ALL_METADATA = ('metadata',)
+ALL_CONTENTS = ('contents',)
+
+def frame_key(frame):
+    """
+    Frames are rebuilt whenever their file is parsed, so they are
+    identified by their source node and definition.
+    """
+    return (frame.source_node.id, frame.param_string)
+
+def node_signature(node):
+    """
+    Holds the node itself in place of its stripped contents, which are
+    only derived if its source text changed.
+    """
+    metadata = []
+    for keyname, entries in node.metadata.entries_dict.items():
+        for entry in entries:
+            metadata.append((keyname, tuple(v.text_lower for v in entry.meta_values)))
+    return (
+        node.title,
+        tuple(sorted(metadata, key=repr)),
+        node.source_contents(),
+        frozenset(node.links_ids()),
+        node)
+
+def contents_differ(previous, current):
+    if previous[2] == current[2]:
+        return False
+    if previous[4] is None or current[4] is None:
+        return True
+    return previous[4].stripped_contents != current[4].stripped_contents
+
+class FrameDependencies:
+    """
+    Records what each frame's output was built from, as it runs:
+    ('title', id), ('metadata', id), ('contents', id) and
+    ('links_from', id) for nodes it included or looked up,
+    ('key', keyname) or ('value', keyname, lowercased value) for
+    metadata queries, ('links_to', id) for backlink queries, and
+    ALL_NODES, ALL_METADATA or ALL_CONTENTS for queries over every node.
+
+    Nodes added to and dropped from the project are compared with
+    what they replaced, to give changes in the same form, so that after
+    an edit only the frames depending on what changed are run again.
+    Frames are stored by frame_key().
+    """
+
+    def __init__(self):
+        self.frame_dependencies = {}
+        self.dependents = {}
+        # read-only calls from other threads record nothing
+        self.running = threading.local()
+        self.changes = set()
+        self.previous_nodes = {}
+        self.current_nodes = {}
+
+    def start_frame(self, frame):
+        key = frame_key(frame)
+        self.remove_frame(key)
+        self.frame_dependencies[key] = set()
+        self.running.frame = key
+
+    def end_frame(self):
+        self.running.frame = None
+
+    def record(self, dependency):
+        key = getattr(self.running, 'frame', None)
+        if key is None:
+            return
+        dependencies = self.frame_dependencies.get(key)
+        if dependencies is None or dependency in dependencies:
+            return
+        dependencies.add(dependency)
+        self.dependents.setdefault(dependency, {})[key] = None
+
+    def record_all_nodes(self):
+        self.record(ALL_NODES)
+
+    def record_all_contents(self):
+        self.record(ALL_NODES)
+        self.record(ALL_CONTENTS)
+
+    def record_node(self, node_id):
+        """ the node's existence and title """
+        self.record(('title', node_id))
+
+    def record_node_metadata(self, node_id):
+        self.record(('metadata', node_id))
+
+    def record_node_contents(self, node_id):
+        self.record(('contents', node_id))
+
+    def record_links_from(self, node_id):
+        self.record(('links_from', node_id))
+
+    def record_key(self, keyname):
+        if keyname == '*':
+            self.record(ALL_NODES)
+            return self.record(ALL_METADATA)
+        self.record(('key', keyname.lower()))
+
+    def record_value(self, keyname, value):
+        self.record(('value', keyname.lower(), value.lower()))
+
+    def record_links_to(self, node_id):
+        self.record(('links_to', node_id))
+
+    def remove_frame(self, key):
+        for dependency in self.frame_dependencies.pop(key, ()):
+            frames = self.dependents[dependency]
+            del frames[key]
+            if not frames:
+                del self.dependents[dependency]
+
+    def remove_frames_except(self, keys):
+        for key in [k for k in self.frame_dependencies if k not in keys]:
+            self.remove_frame(key)
+
+    def node_added(self, node):
+        self.previous_nodes.setdefault(node.id, None)
+        self.current_nodes[node.id] = node_signature(node)
+
+    def node_dropped(self, node):
+        self.previous_nodes.setdefault(node.id, node_signature(node))
+        self.current_nodes[node.id] = None
+
+    def metadata_changed(self, node):
+        """ records metadata added to or removed from a node in place """
+        self.changes.update([('metadata', node.id), ALL_METADATA])
+        self._add_metadata_changes(node_signature(node)[1])
+
+    def contents_changed(self, node_id):
+        self.changes.update([('metadata', node_id), ('contents', node_id), ALL_CONTENTS])
+
+    def take_changes(self):
+        """ returns the changes since the last call, comparing replaced nodes """
+        for node_id, previous in self.previous_nodes.items():
+            current = self.current_nodes[node_id]
+            if previous is not None and current is not None and previous[:4] == current[:4]:
+                continue
+            if previous is None or current is None:
+                self.changes.add(ALL_NODES)
+                previous = previous or ('', (), '', frozenset(), None)
+                current = current or ('', (), '', frozenset(), None)
+            if previous[0] != current[0]:
+                self.changes.add(('title', node_id))
+            if previous[1] != current[1]:
+                self.changes.update([('metadata', node_id), ALL_METADATA])
+                self._add_metadata_changes(previous[1])
+                self._add_metadata_changes(current[1])
+            if contents_differ(previous, current):
+                self.changes.update([('contents', node_id), ALL_CONTENTS])
+            if previous[3] != current[3]:
+                self.changes.add(('links_from', node_id))
+                for linked_id in previous[3] ^ current[3]:
+                    self.changes.add(('links_to', linked_id))
+        changes = self.changes
+        self.changes = set()
+        self.previous_nodes = {}
+        self.current_nodes = {}
+        return changes
+
+    def _add_metadata_changes(self, metadata):
+        for keyname, values in metadata:
+            self.changes.add(('key', keyname))
+            for value in values:
+                self.changes.add(('value', keyname, value))
+
+    def get_dependent_frames(self, changes):
+        """ keys of frames with recorded dependencies on any of the changes """
+        frames = {}
+        for dependency in changes:
+            frames.update(self.dependents.get(dependency, {}))
+        return frames
@@ -0,0 +1,30 @@
+class LinkGraph:
+    """
+    Node links in both directions: node -> IDs it links to,
+    and ID -> nodes linking to it.
+    """
+
+    def __init__(self):
+        self.outgoing = {}
+        self.incoming = {}
+
+    def add_node(self, node):
+        self.remove_node(node)
+        outgoing = set(node.links_ids())
+        for node_id in outgoing:
+            self.incoming.setdefault(node_id, {})[node] = None
+        self.outgoing[node] = outgoing
+
+    def remove_node(self, node):
+        for node_id in self.outgoing.pop(node, ()):
+            incoming = self.incoming[node_id]
+            del incoming[node]
+            if not incoming:
+                del self.incoming[node_id]
+
+    def get_links_to(self, node_id):
+        """ nodes linking to node_id, in the order they were added """
+        return list(self.incoming.get(node_id, ()))
+
+    def get_links_from(self, node):
+        return list(self.outgoing.get(node, ()))
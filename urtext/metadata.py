@@ -14,97 +14,15 @@ class NodeMetadata:
         self.project = project
    
     def parse_contents(self, full_contents):
-        parsed_contents = full_contents
-        remaining_contents = full_contents
-
-        for m in syntax.metadata_entry_c.finditer(full_contents):
-            keyname, contents = m.group().strip(syntax.metadata_end_marker).split(syntax.metadata_assigner, 1)
-            value_list = []
-            for pattern in syntax.special_metadata_patterns_c.finditer(contents):
-                value_list.append(pattern.group())
-                contents = contents.replace(pattern.group(),'')
-            value_list.extend(syntax.metadata_separator_pattern_c.split(contents))       
-            value_list = [v.strip() for v in value_list if v.strip()]
-            tag_self, tag_children, tag_descendants, keyname = determine_desc_tagging(keyname)
-
-            self.add_entry(
-                keyname,
-                value_list,
-                self.node,
-                tag_self=tag_self,
-                tag_children=tag_children,
-                tag_descendants=tag_descendants,
-                start_position=m.start(),
-                end_position=m.start() + len(m.group().strip()))
-
-            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
-            remaining_contents = remaining_contents.replace(m.group(), '', 1)
-
-        for m in syntax.hash_meta_c.finditer(parsed_contents):
-            tag_self=False
-            tag_children=False
-            tag_descendants=False
-            
-            entry = m.group().strip()
-            tag_self, tag_children, tag_descendants, entry = determine_desc_tagging(entry)
-            value = entry.strip().replace('-',' ')
-            value = value[1:]
-
-            keyname = '#'
-            if self.project.compiled:
-                hash_key_setting = self.project.get_single_setting('hash_key')
-                if hash_key_setting:
-                    keyname = hash_key_setting.text
-
-            self.add_entry(
-                keyname,
-                value,
-                self.node,
-                tag_self=tag_self,
-                tag_children=tag_children,
-                tag_descendants=tag_descendants,
-                start_position=m.start(), 
-                end_position=m.start() + len(m.group()))
-            
-            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
-            remaining_contents = remaining_contents.replace(m.group(), '', 1)
-
-        # inline timestamps:
-        for m in syntax.timestamp_c.finditer(parsed_contents):
-            self.add_entry(
-                '_inline_timestamp',
-                m.group(),
-                self.node,
-                start_position=m.start(),
-                end_position=m.start() + len(m.group()))
-            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
-            remaining_contents = remaining_contents.replace(m.group(), '', 1)
-
-        #remove from contents entries without or entries that are nodes:
-        for m in syntax.metadata_key_only_c.finditer(parsed_contents):
-            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
-            remaining_contents = remaining_contents.replace(m.group(), '', 1)
-
-        for m in syntax.bold_text_c.finditer(parsed_contents):
-            self.add_entry(
-                '_bold',
-                m.group(),
-                self.node,
-                start_position=m.start(),
-                end_position=m.start() + len(m.group()))
-            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
-            remaining_contents = remaining_contents.replace(m.group(), '', 1)
-
-        for m in syntax.italic_text_c.finditer(parsed_contents):
-            self.add_entry(
-                '_italic',
-                m.group(),
-                self.node,
-                start_position=m.start(),
-                end_position=m.start() + len(m.group()))
-            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
-            remaining_contents = remaining_contents.replace(m.group(), '', 1)
-
+        remaining_contents, parsed_contents, found_entries = find_entries(full_contents)
+        for keyname, values, entry_kwargs in found_entries:
+            if keyname is None:
+                keyname = '#'
+                if self.project.compiled:
+                    hash_key_setting = self.project.get_single_setting('hash_key')
+                    if hash_key_setting:
+                        keyname = hash_key_setting.text
+            self.add_entry(keyname, values, self.node, **entry_kwargs)
         self.add_system_keys()
         return remaining_contents, parsed_contents
 
@@ -332,3 +250,71 @@ def get_extended_metadata(extended_keyname, node):
                 values.append(v.timestamp.unwrapped_string) 
                 continue
     return values
+
+def find_entries(full_contents):
+    """
+    Returns the contents with metadata removed, the contents with
+    metadata replaced by whitespace, and (keyname, values, keyword
+    arguments) for each entry found. Hash entries have keyname None,
+    since their key comes from the project's hash_key setting.
+    """
+    parsed_contents = full_contents
+    remaining_contents = full_contents
+    found_entries = []
+
+    for m in syntax.metadata_entry_c.finditer(full_contents):
+        keyname, contents = m.group().strip(syntax.metadata_end_marker).split(syntax.metadata_assigner, 1)
+        value_list = []
+        for pattern in syntax.special_metadata_patterns_c.finditer(contents):
+            value_list.append(pattern.group())
+            contents = contents.replace(pattern.group(),'')
+        value_list.extend(syntax.metadata_separator_pattern_c.split(contents))
+        value_list = [v.strip() for v in value_list if v.strip()]
+        tag_self, tag_children, tag_descendants, keyname = determine_desc_tagging(keyname)
+        found_entries.append((keyname, value_list, {
+            'tag_self': tag_self,
+            'tag_children': tag_children,
+            'tag_descendants': tag_descendants,
+            'start_position': m.start(),
+            'end_position': m.start() + len(m.group().strip())}))
+        parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
+        remaining_contents = remaining_contents.replace(m.group(), '', 1)
+
+    for m in syntax.hash_meta_c.finditer(parsed_contents):
+        entry = m.group().strip()
+        tag_self, tag_children, tag_descendants, entry = determine_desc_tagging(entry)
+        value = entry.strip().replace('-',' ')
+        value = value[1:]
+        found_entries.append((None, value, {
+            'tag_self': tag_self,
+            'tag_children': tag_children,
+            'tag_descendants': tag_descendants,
+            'start_position': m.start(),
+            'end_position': m.start() + len(m.group())}))
+        parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
+        remaining_contents = remaining_contents.replace(m.group(), '', 1)
+
+    # inline timestamps:
+    for m in syntax.timestamp_c.finditer(parsed_contents):
+        found_entries.append(('_inline_timestamp', m.group(), {
+            'start_position': m.start(),
+            'end_position': m.start() + len(m.group())}))
+        parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
+        remaining_contents = remaining_contents.replace(m.group(), '', 1)
+
+    #remove from contents entries without or entries that are nodes:
+    for m in syntax.metadata_key_only_c.finditer(parsed_contents):
+        parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
+        remaining_contents = remaining_contents.replace(m.group(), '', 1)
+
+    for keyname, pattern in [
+        ('_bold', syntax.bold_text_c),
+        ('_italic', syntax.italic_text_c)]:
+        for m in pattern.finditer(parsed_contents):
+            found_entries.append((keyname, m.group(), {
+                'start_position': m.start(),
+                'end_position': m.start() + len(m.group())}))
+            parsed_contents = parsed_contents.replace(m.group(), ' '*len(m.group()), 1)
+            remaining_contents = remaining_contents.replace(m.group(), '', 1)
+
+    return remaining_contents, parsed_contents, found_entries
@@ -5,6 +5,10 @@ import re
 
 class MetadataEntry:  # container for a single metadata entry
 
+    __slots__ = (
+        'node', 'keyname', 'tag_self', 'tag_children', 'tag_descendants',
+        'from_node', 'start_position', 'end_position', 'meta_values')
+
     def __init__(self, 
         keyname, 
         values,
@@ -26,7 +30,7 @@ class MetadataEntry:  # container for a single metadata entry
         self.end_position = end_position
         self.meta_values = []
         for v in values:
-            value = MetadataValue(self.node.project)
+            value = MetadataValue()
             if isinstance(v, str):
                 value.set_from_text(v)
             else:
@@ -0,0 +1,163 @@
+import bisect
+from urtext.timestamp import default_date
+
+class MetadataIndex:
+    """
+    Project-wide inverted index of metadata values:
+    key -> form -> value -> nodes, where form is the value's
+    text, lowercased text or number, or '*' for any value.
+    Only entries tagged to the node itself are indexed,
+    as in NodeMetadata.get_values().
+
+    Also keeps, for each key, the nodes sorted by the datetime of
+    the timestamp NodeMetadata.get_date() gives for that key,
+    for range queries.
+
+    For keys sorted on, once first asked for, keeps each node's first
+    value and the nodes ordered by it, so that sorting the project's
+    nodes needs no sort.
+    """
+
+    def __init__(self):
+        self.keys = {}
+        self.node_postings = {}
+        self.dates = {}
+        self.node_dates = {}
+        self.first_values = {}
+        self.orderings = {}
+        self.node_sort_keys = {}
+
+    def add_node(self, node):
+        """ (re)indexes all of the node's metadata """
+        self.remove_node(node)
+        postings = set()
+        for keyname, entries in node.metadata.entries_dict.items():
+            for entry in entries:
+                if not entry.tag_self:
+                    continue
+                for value in entry.meta_values:
+                    if value.text:
+                        postings.add((keyname, 'text', value.text))
+                    postings.add((keyname, 'lower', value.text_lower))
+                    postings.add((keyname, 'num', value.num()))
+                    postings.add((keyname, '*', None))
+        for keyname, form, value in postings:
+            forms = self.keys.setdefault(keyname, {})
+            forms.setdefault(form, {}).setdefault(value, set()).add(node)
+        self.node_postings[node] = postings
+        self._add_dates(node)
+        for keyname in self.first_values:
+            self._add_first_value(keyname, node)
+
+    def _add_dates(self, node):
+        node_dates = []
+        for keyname in node.metadata.entries_dict:
+            try:
+                timestamp = node.metadata.get_date(keyname)
+            except TypeError: # values that cannot be sorted
+                continue
+            if timestamp is None or timestamp is default_date:
+                continue
+            date = timestamp.datetime
+            if date == default_date:
+                continue
+            dates, nodes = self.dates.setdefault(keyname, ([], []))
+            position = bisect.bisect_right(dates, date)
+            dates.insert(position, date)
+            nodes.insert(position, node)
+            node_dates.append((keyname, date))
+        self.node_dates[node] = node_dates
+
+    def _add_first_value(self, keyname, node):
+        try:
+            value = node.metadata.get_first_value(keyname)
+        except TypeError: # values that cannot be sorted
+            return
+        if value is None:
+            return
+        self.first_values[keyname][node] = value
+        for ordering_key in self.orderings:
+            if ordering_key[0] == keyname:
+                self._add_to_ordering(ordering_key, node, value)
+
+    def _add_to_ordering(self, ordering_key, node, value):
+        sort_keys, nodes = self.orderings[ordering_key]
+        # kept, as node_dates are, since the node's ID can change
+        sort_key = (get_sort_key(value, ordering_key[1]), node.id)
+        position = bisect.bisect_right(sort_keys, sort_key)
+        sort_keys.insert(position, sort_key)
+        nodes.insert(position, node)
+        self.node_sort_keys.setdefault(node, []).append((ordering_key, sort_key))
+
+    def remove_node(self, node):
+        for first_values in self.first_values.values():
+            first_values.pop(node, None)
+        for ordering_key, sort_key in self.node_sort_keys.pop(node, ()):
+            sort_keys, nodes = self.orderings[ordering_key]
+            position = bisect.bisect_left(sort_keys, sort_key)
+            while nodes[position] is not node:
+                position += 1
+            del sort_keys[position]
+            del nodes[position]
+        for keyname, form, value in self.node_postings.pop(node, ()):
+            values = self.keys[keyname][form]
+            nodes = values[value]
+            nodes.discard(node)
+            if not nodes:
+                del values[value]
+                if not values:
+                    del self.keys[keyname][form]
+                    if not self.keys[keyname]:
+                        del self.keys[keyname]
+        for keyname, date in self.node_dates.pop(node, ()):
+            dates, nodes = self.dates[keyname]
+            position = bisect.bisect_left(dates, date)
+            while nodes[position] is not node:
+                position += 1
+            del dates[position]
+            del nodes[position]
+            if not dates:
+                del self.dates[keyname]
+
+    def get_nodes(self, keyname, form, value=None):
+        return self.keys.get(keyname.lower(), {}).get(form, {}).get(value, set())
+
+    def get_keys(self):
+        return list(self.keys)
+
+    def get_first_values(self, keyname):
+        """ node -> the node's first value for keyname, if it has one """
+        keyname = keyname.lower()
+        if keyname not in self.first_values:
+            self.first_values[keyname] = {}
+            for node in self.node_postings:
+                self._add_first_value(keyname, node)
+        return self.first_values[keyname]
+
+    def get_ordering(self, keyname, use_timestamp):
+        """
+        Returns the nodes with a value for keyname, ordered by their
+        first value's timestamp or text, then by ID.
+        """
+        keyname = keyname.lower()
+        ordering_key = (keyname, use_timestamp)
+        if ordering_key not in self.orderings:
+            first_values = self.get_first_values(keyname)
+            self.orderings[ordering_key] = ([], [])
+            for node, value in sorted(
+                    first_values.items(),
+                    key=lambda item: (get_sort_key(item[1], use_timestamp), item[0].id)):
+                self._add_to_ordering(ordering_key, node, value)
+        return list(self.orderings[ordering_key][1])
+
+    def get_nodes_by_date(self, keyname, after=None, before=None):
+        """ nodes whose date for keyname is strictly between after and before """
+        dates, nodes = self.dates.get(keyname.lower(), ([], []))
+        start = bisect.bisect_right(dates, after) if after else 0
+        end = bisect.bisect_left(dates, before) if before else len(dates)
+        return nodes[start:end]
+
+def get_sort_key(value, use_timestamp):
+    if use_timestamp:
+        return value.timestamp.datetime if value.timestamp else default_date
+    return value.text or ''
@@ -5,14 +5,22 @@ import os
 
 class MetadataValue:
 
-    def __init__(self, project):
+    __slots__ = (
+        'timestamp', 'node_as_value', 'text_lower', 'text',
+        'unparsed_text', 'entry')
+
+    def __init__(self):
         self.timestamp = None
-        self.project = project
         self.node_as_value = False
         self.text_lower = None
         self.text = None
         self.unparsed_text = None
-        
+        self.entry = None
+
+    @property
+    def project(self):
+        return self.entry.node.project
+
     def set_as_node(self, node):
         self.node_as_value = node
 
@@ -1,18 +1,40 @@
 import re
-from urtext.metadata import NodeMetadata
+import threading
+from collections import OrderedDict
+from urtext.metadata import NodeMetadata, find_entries
 from urtext.frame import UrtextFrame
 import urtext.utils as utils
 import urtext.syntax as syntax
 
+CONTENTS_CACHE_SIZE = 2000
+contents_cache = OrderedDict()
+contents_cache_lock = threading.Lock()
+
 class UrtextNode:
 
     urtext_metadata = NodeMetadata
+    __slots__ = (
+        'project', 'ranges', 'is_tree', 'is_node', 'is_meta', 'meta_key',
+        'export_points', 'marked_dynamic', 'is_dynamic', 'id',
+        'needs_resolution', 'pointers', 'display_detail', 'links',
+        'is_root_node', 'frames', 'target_nodes', 'untitled', 'title_only',
+        'title', 'parent', 'children', 'first_line_title',
+        'title_from_marker', 'nested', 'resolution', 'filename',
+        'embedded_syntax_ranges', 'frame_ranges', 'source', 'metadata',
+        'text', 'buffer', 'file', 'start_position', 'end_position')
 
     def __init__(self, 
         contents,
         project,
         root=False,
-        nested=None):
+        nested=None,
+        source_ranges=None):
+        """
+        If source_ranges is given, contents is the string the node's
+        ranges are taken from. Only the node's own text is kept, so that
+        the node does not keep the whole buffer contents alive; the
+        rest is derived from it when asked for.
+        """
 
         self.project = project
         self.ranges = []
@@ -43,11 +65,14 @@ class UrtextNode:
         self.filename = None
         self.embedded_syntax_ranges = []
         self.frame_ranges = []
-        
+        if source_ranges is not None:
+            contents = ''.join([contents[r[0]:r[1]] for r in source_ranges])
+        self.source = contents
+
         ranges, stripped_contents = utils.strip_backtick_escape(contents)
         self.embedded_syntax_ranges.extend(ranges)
         stripped_contents = utils.strip_whitespace_anchors(stripped_contents)
-        self.full_contents = stripped_contents
+        full_contents = stripped_contents
 
         ranges, stripped_contents, replaced_contents = utils.strip_embedded_syntaxes(stripped_contents)
         self.embedded_syntax_ranges.extend(ranges)
@@ -57,7 +82,6 @@ class UrtextNode:
         self.frame_ranges, stripped_contents, replaced_contents = self.parse_frames(replaced_contents)
         self.metadata = self.urtext_metadata(self, self.project)        
         stripped_contents, replaced_contents = self.metadata.parse_contents(replaced_contents)
-        self.replaced_contents = replaced_contents
         for link in self.links:
             stripped_contents = stripped_contents.replace(link.matching_string, '', 1)        
         self.title = self.set_title(stripped_contents)
@@ -68,9 +92,55 @@ class UrtextNode:
             d.source_node = self
         for entry in self.metadata.entries():
             entry.from_node = self
-        self.stripped_contents = stripped_contents   
         self.text = utils.make_node_link(self.id)
 
+    def source_contents(self):
+        """ the node's text as passed to it, before any stripping """
+        return self.source
+
+    @property
+    def full_contents(self):
+        return self._derived_contents()[0]
+
+    @property
+    def replaced_contents(self):
+        return self._derived_contents()[1]
+
+    @property
+    def stripped_contents(self):
+        return self._derived_contents()[2]
+
+    def _derived_contents(self):
+        """
+        Repeats the stripping done in __init__ without its side
+        effects. The most recently used results are kept in
+        contents_cache.
+        """
+        with contents_cache_lock:
+            derived = contents_cache.get(self)
+            if derived is not None:
+                contents_cache.move_to_end(self)
+                return derived
+        _r, full_contents = utils.strip_backtick_escape(self.source_contents())
+        full_contents = utils.strip_whitespace_anchors(full_contents)
+        _r, _s, replaced_contents = utils.strip_embedded_syntaxes(full_contents)
+        replaced_contents = check_dynamic_marker(replaced_contents)[0]
+        replaced_contents = utils.strip_frames(replaced_contents)
+        stripped_contents, replaced_contents, _e = find_entries(replaced_contents)
+        for link in self.links:
+            stripped_contents = stripped_contents.replace(link.matching_string, '', 1)
+        derived = (full_contents, replaced_contents, stripped_contents)
+        with contents_cache_lock:
+            contents_cache[self] = derived
+            while len(contents_cache) > CONTENTS_CACHE_SIZE:
+                contents_cache.popitem(last=False)
+        return derived
+
+    def drop_derived_contents(self):
+        """ call when the node leaves its project """
+        with contents_cache_lock:
+            contents_cache.pop(self, None)
+
     def get_file_position(self, node_position): 
         node_length = 0
         offset_position = node_position
@@ -109,11 +179,12 @@ class UrtextNode:
     def links_ids(self):
         return [link.node_id for link in self.links]
 
-    def resolve_id(self, existing_nodes=[]):
+    def resolve_id(self, existing_nodes=[], existing_ids=None):
         if self.resolution:
             return self.id
         newest_timestamp = self.metadata.get_newest_timestamp()
-        existing_ids = [n.id for n in existing_nodes]
+        if existing_ids is None:
+            existing_ids = [n.id for n in existing_nodes]
         if newest_timestamp:
             resolved_id = ''.join([
                 self.title,
@@ -263,12 +334,7 @@ class UrtextNode:
                 ])
         else:
             new_node_contents = new_contents
-        buffer_contents = self.buffer._get_contents()
-        new_buffer_contents = ''.join([
-            buffer_contents[:self.start_position],
-            new_node_contents,
-            buffer_contents[self.end_position:]])
-        self.buffer.set_buffer_contents(new_buffer_contents)
+        self.buffer.replace_node_contents(self, new_node_contents)
         # re-parses within buffer but does not re-parse into project
 
     def replace_range(self, 
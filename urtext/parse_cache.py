@@ -0,0 +1,164 @@
+import os
+import io
+import re
+import copyreg
+import pickle
+import hashlib
+from urtext.frame import UrtextFrame
+
+CACHE_VERSION = 6
+CACHE_FILENAME = '.urtext_parse_cache'
+
+class UrtextParseCache:
+    """
+    Keeps the parsed form of each file, as it was before being merged
+    into the project, so unchanged files can be loaded on the next start
+    without lexing and parsing. Entries are keyed by filename and checked
+    against the file's mtime, size and a hash of its contents.
+    """
+
+    def __init__(self, project):
+        self.project = project
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.enabled = False
+        self.path = None
+        if project.entry_point:
+            folder = project.entry_point
+            if not os.path.isdir(folder):
+                folder = os.path.dirname(folder)
+            self.path = os.path.join(folder, CACHE_FILENAME)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            return
+        if cache.get('version') == CACHE_VERSION:
+            self.entries = cache['files']
+            self.enabled = True
+
+    def save(self):
+        """ writes the entries for the project's current files and releases them """
+        if not self.path:
+            return
+        entries = {
+            f: self.entries[f] for f in self.entries if f in self.project.files}
+        self.entries = {}
+        try:
+            with open(self.path, 'wb') as f:
+                pickle.dump({
+                    'version': CACHE_VERSION,
+                    'files': entries
+                    }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+
+    def remove(self):
+        self.entries = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def has_current_entry(self, filename):
+        """ whether there is an entry matching the file's mtime and size """
+        entry = self.entries.get(filename)
+        if not entry:
+            return False
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == entry[:2]
+
+    def get(self, filename):
+        """ returns the cached buffer for filename, or None """
+        if not self.has_current_entry(filename):
+            self.entries.pop(filename, None)
+            self.misses += 1
+            return None
+        contents_hash, pickled_buffer = self.entries[filename][2:]
+        try:
+            buffer = load_buffer(pickled_buffer, self.project)
+            contents = buffer._read_contents()
+            if contents is None or hash_contents(contents) != contents_hash:
+                raise ValueError
+        except Exception:
+            del self.entries[filename]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return buffer
+
+    def add(self, buffer, pickled_buffer=None):
+        if buffer.contents is None:
+            return
+        try:
+            stat = os.stat(buffer.filename)
+            if pickled_buffer is None:
+                pickled_buffer = dump_buffer(buffer, self.project)
+        except Exception:
+            self.entries.pop(buffer.filename, None)
+            return
+        self.entries[buffer.filename] = (
+            stat.st_mtime_ns,
+            stat.st_size,
+            hash_contents(buffer.contents),
+            pickled_buffer)
+
+class BufferPickler(pickle.Pickler):
+    """
+    Pickles a buffer and its nodes, leaving out the project,
+    the project list and frames, which are rebuilt when loaded.
+    """
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[re.Match] = lambda m: (rematch, (m.re, m.string, m.start()))
+
+    def __init__(self, file, project):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.project = project
+
+    def persistent_id(self, obj):
+        if obj is self.project:
+            return 'project'
+        if obj is not None and obj is self.project.project_list:
+            return 'project_list'
+        if isinstance(obj, UrtextFrame):
+            return ('frame', obj.param_string, obj.position, obj.end_position)
+        return None
+
+class BufferUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, project):
+        super().__init__(file)
+        self.project = project
+
+    def persistent_load(self, pid):
+        if pid == 'project':
+            return self.project
+        if pid == 'project_list':
+            return self.project.project_list
+        if pid[0] == 'frame':
+            return UrtextFrame(pid[1], self.project, pid[2], pid[3])
+        raise pickle.UnpicklingError('unknown persistent id %s' % pid)
+
+def dump_buffer(buffer, project):
+    pickled_buffer = io.BytesIO()
+    BufferPickler(pickled_buffer, project).dump(buffer)
+    return pickled_buffer.getvalue()
+
+def load_buffer(pickled_buffer, project):
+    buffer = BufferUnpickler(io.BytesIO(pickled_buffer), project).load()
+    for node in buffer.nodes:
+        for frame in node.frames:
+            frame.source_node = node
+    return buffer
+
+def rematch(pattern, string, position):
+    return pattern.match(string, position)
+
+def hash_contents(contents):
+    return hashlib.sha1(contents.encode('utf-8')).hexdigest()
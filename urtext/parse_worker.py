@@ -0,0 +1,32 @@
+from urtext.parse_cache import dump_buffer
+
+class WorkerProjectList:
+    """
+    Stands in for the project list the buffer's links refer to,
+    so that they are pickled, as the project is, to be rebound.
+    """
+
+class WorkerProject:
+    """
+    Stands in for the project while a file is parsed in a worker
+    process. The buffer is pickled without it and rebound to the
+    real project when loaded.
+    """
+    compiled = False
+
+    def __init__(self):
+        self.project_list = WorkerProjectList()
+
+    def get_single_setting(self, setting):
+        return None
+
+    def get_call(self, call_name):
+        return None
+
+    def run_editor_method(self, method_name, *args, **kwargs):
+        return None
+
+def parse_file(filename, urtext_file):
+    """ parses filename and returns the pickled buffer """
+    project = WorkerProject()
+    return dump_buffer(urtext_file(filename, project), project)
@@ -4,14 +4,24 @@ import platform
 import os
 import time
 import threading
+import concurrent.futures
 from urtext.file import UrtextFile, UrtextBuffer
 from urtext.node import UrtextNode
-from urtext.timestamp import date_from_timestamp, default_date, UrtextTimestamp
+from urtext.timestamp import date_from_timestamp, UrtextTimestamp
+from urtext.timestamp import add_timestamp_format, default_timestamp_format
 from urtext.call import UrtextCall
 import urtext.syntax as syntax
 import urtext.utils as utils
 from urtext.exec import Exec
 from urtext.action import UrtextAction
+from urtext.parse_cache import UrtextParseCache, load_buffer
+from urtext.parse_worker import parse_file
+from urtext.metadata_index import MetadataIndex, get_sort_key
+from urtext.link_graph import LinkGraph
+from urtext.contents_index import ContentsIndex
+from urtext.query import QueryClause, plan_query
+from urtext.frame_dependencies import FrameDependencies, frame_key
+from urtext.file_watcher import UrtextFileWatcher
 from itertools import chain
 
 class UrtextProject:
@@ -37,7 +47,11 @@ class UrtextProject:
         self.time = time.time()
         self.last_compile_time = 0
         self.nodes = {}
+        self.titled_nodes = {}
         self.project_settings_nodes = []
+        self.settings_cache = {}
+        self.settings_cache_hits = 0
+        self.settings_cache_misses = 0
         self.files = {}
         self.buffers = {}
         self.last_exec_node = None
@@ -47,6 +61,10 @@ class UrtextProject:
         self.messages = {}
         self.virtual_outputs = {}
         self.dynamic_metadata_entries = []
+        self.metadata_index = MetadataIndex()
+        self.link_graph = LinkGraph()
+        self.contents_index = ContentsIndex()
+        self.frame_dependencies = FrameDependencies()
         self.calls = {}
         self.project_instance_calls = {}
         self.initialized = False
@@ -56,9 +74,36 @@ class UrtextProject:
         self.new_file_node_created = new_file_node_created
         self.initial_project = initial
         self.visible = None
+        self.parse_cache = UrtextParseCache(self)
+        self.parsed_in_workers = {}
+        self.file_watcher = None
+        self.settings_paths_cache = None
+        self.settings_paths_lock = threading.Lock()
 
     def get_setting(self, setting, _called_from_project_list=False, use_project_list=True):
-
+        """
+        Values are cached until a project_settings node in this
+        or any other project in the list changes.
+        """
+        for node_id in self.project_settings_nodes:
+            self.frame_dependencies.record_node_metadata(node_id)
+        cache_key = (setting, _called_from_project_list, use_project_list)
+        values = self.settings_cache.get(cache_key)
+        if values is not None:
+            self.settings_cache_hits += 1
+            return list(values)
+        self.settings_cache_misses += 1
+        if not self.project_list:
+            values = self._get_setting(setting, _called_from_project_list, use_project_list)
+            self.settings_cache[cache_key] = values
+            return list(values)
+        # other projects' settings can change while these are found
+        generation = self.project_list.settings_generation
+        values = self._get_setting(setting, _called_from_project_list, use_project_list)
+        self.project_list.cache_setting(self, cache_key, values, generation)
+        return list(values)
+
+    def _get_setting(self, setting, _called_from_project_list, use_project_list):
         values = []
         for node_id in self.project_settings_nodes:
             values.extend(self.nodes[node_id].metadata.get_values(setting))
@@ -72,6 +117,11 @@ class UrtextProject:
             values = [v.num() for v in values]
         return values
 
+    def _settings_changed(self):
+        self.settings_cache.clear()
+        if self.project_list:
+            self.project_list.clear_settings_caches()
+
     def get_single_setting(self, setting, _called_from_project_list=False, use_project_list=True):
         values = self.get_setting(
             setting, 
@@ -114,6 +164,7 @@ class UrtextProject:
             self.add_call(call)
         for call in self.project_list.project_instance_calls.values():
             self.add_call(call)
+        self.parse_cache.load()
         if os.path.exists(self.entry_point):
             if os.path.isdir(self.entry_point) and self._approve_new_path(self.entry_point):
                 self.entry_path = os.path.abspath(self.entry_point)
@@ -125,8 +176,7 @@ class UrtextProject:
             included_files = self._get_included_files()
             if included_files and visible:
                 self.handle_info_message('Initializing Urtext project from %s' % os.path.basename(self.entry_point))
-            for file in included_files:
-                self._parse_file(file)
+            self._parse_files(included_files)
         if not self.files:
             if self.new_file_node_created is False:
                 return False
@@ -136,6 +186,8 @@ class UrtextProject:
         self._add_paths_from_settings()
         for node in self.nodes.values():
             node.metadata.convert_hash_keys()
+            self.metadata_index.add_node(node)
+        self._settings_changed()
         self._add_all_sub_tags()
         self._mark_dynamic_nodes()
         self.initialized = True
@@ -153,6 +205,11 @@ class UrtextProject:
                     continue
                 self.project_list._init_project(os.path.abspath(utils.get_path_from_link(value.text)))
 
+        if self.setting_is_true('parse_cache'):
+            self.parse_cache.save()
+        else:
+            self.parse_cache.remove()
+        self._update_file_watcher()
         self.compiled = True
         self.last_compile_time = time.time() - self.time
         self.time = time.time()
@@ -166,9 +223,7 @@ class UrtextProject:
         for p in self.get_settings_paths():
             if self._approve_new_path(p):
                 self.paths.append(p)
-                for file in self._get_included_files():
-                    if file not in self.files:
-                        self._parse_file(file)
+                self._parse_files([f for f in self._get_included_files() if f not in self.files])
         if len(self.get_settings_paths()) > num_paths or (
             len(self.get_setting('file_extensions')) > num_file_extensions):
             self._add_paths_from_settings()
@@ -215,6 +270,11 @@ class UrtextProject:
             self._add_to_excluded_files(filename)
             return False
 
+        if self.compiled and not try_buffer and filename in self.files:
+            buffer = self._parse_edited_file(filename)
+            if buffer:
+                return buffer
+
         existing_buffer_ids = None
         if filename in self.files:
             existing_nodes = [n for n in self.nodes.values() if n.filename == filename]
@@ -229,11 +289,60 @@ class UrtextProject:
                 buffer = self._make_buffer(filename, buffer_contents)
             else:
                 buffer = self.urtext_file(filename, self)
+        elif not self.compiled:
+            buffer = self._load_file(filename)
         else:
             buffer = self.urtext_file(filename, self)
         if buffer:
             return self._parse_buffer(buffer, existing_buffer_ids=existing_buffer_ids)
 
+    def _parse_files(self, filenames):
+        """
+        Parses the files in order. If the parse_workers setting is more
+        than 1, files not in the parse cache are lexed and parsed in that
+        many processes first, and merged into the project here.
+        """
+        workers = self.get_single_setting('parse_workers')
+        workers = int(workers.num()) if workers and workers.num() != float('inf') else 0
+        to_parse = [f for f in filenames if not self.parse_cache.has_current_entry(f)]
+        if workers < 2 or len(to_parse) < 2:
+            for filename in filenames:
+                self._parse_file(filename)
+            return
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            for filename in to_parse:
+                self.parsed_in_workers[filename] = executor.submit(
+                    parse_file, filename, self.urtext_file)
+            for filename in filenames:
+                self._parse_file(filename)
+            self.parsed_in_workers = {}
+
+    def _get_parsed_in_worker(self, filename):
+        future = self.parsed_in_workers.pop(filename, None)
+        if not future:
+            return None, None
+        try:
+            pickled_buffer = future.result()
+            buffer = load_buffer(pickled_buffer, self)
+        except Exception:
+            return None, None
+        if self.setting_is_true('use_buffer'):
+            buffer_contents = self.run_editor_method('get_buffer', filename)
+            if buffer_contents and buffer_contents != buffer.contents:
+                return None, None
+        return buffer, pickled_buffer
+
+    def _load_file(self, filename):
+        """ uses the parse cache and worker results while the project is being compiled """
+        buffer = self.parse_cache.get(filename)
+        if not buffer:
+            buffer, pickled_buffer = self._get_parsed_in_worker(filename)
+            if not buffer:
+                buffer, pickled_buffer = self.urtext_file(filename, self), None
+            if self.parse_cache.enabled or self.setting_is_true('parse_cache'):
+                self.parse_cache.add(buffer, pickled_buffer=pickled_buffer)
+        return buffer
+
     def _parse_buffer(self, buffer, existing_buffer_ids=None):
 
         if existing_buffer_ids is None:
@@ -260,16 +369,7 @@ class UrtextProject:
 
         for node in buffer.nodes:
             self._add_node(node)
-            if node.frames:
-                self.frames[node.id] = []
-                for frame in node.frames:
-                    frame.source_node = node
-                    for t in frame.targets:
-                        if t.is_virtual and t.matching_string == "@self":
-                            t.is_node = True
-                            t.node_id = frame.source_node.id
-                    if self._check_conflicting_frames(frame) is True:
-                        self.frames[node.id].append(frame)
+            self._add_node_frames(node)
 
         if buffer.identifier:
             self.buffers[buffer.identifier] = buffer
@@ -294,6 +394,7 @@ class UrtextProject:
                     end_position=target_node.end_position)
                 target_node.is_meta = True
                 target_node.meta_key = keyname
+                self._node_metadata_changed(source_node)
        
         for node in buffer.nodes:
             for entry in node.metadata.entries():
@@ -312,6 +413,59 @@ class UrtextProject:
         self._mark_dynamic_nodes()
         return buffer
 
+    def _add_node_frames(self, node):
+        if node.frames:
+            self.frames[node.id] = []
+            for frame in node.frames:
+                frame.source_node = node
+                for t in frame.targets:
+                    if t.is_virtual and t.matching_string == "@self":
+                        t.is_node = True
+                        t.node_id = frame.source_node.id
+                if self._check_conflicting_frames(frame) is True:
+                    self.frames[node.id].append(frame)
+
+    def _parse_edited_file(self, filename):
+        """
+        Re-parses only the node containing the edit since the file was
+        last parsed, if the buffer is still in sync with the project.
+        Returns None if the file needs a full parse.
+        """
+        buffer = self.files[filename]
+        if not isinstance(buffer, self.urtext_file):
+            return None
+        for node in buffer.nodes:
+            if self.nodes.get(node.id) is not node:
+                return None
+            # no other node has its title now, so a full parse would
+            # no longer resolve its ID but give it the plain title
+            if node.resolution and len(self._find_duplicate_titles(node)) < 2:
+                return None
+            if node.id in self.project_settings_nodes:
+                return None
+        edited_nodes = buffer._parse_edit(buffer._read_contents())
+        if edited_nodes is None:
+            return None
+        for old_node, new_node in edited_nodes:
+            self._drop_node(old_node)
+            self._add_node(new_node)
+            for entry in new_node.metadata.entries():
+                if entry.from_node is new_node and entry.tag_children:
+                    self._add_sub_tags(entry)
+                    self.dynamic_metadata_entries.append(entry)
+        # re-register the file's nodes and frames in buffer order,
+        # as a full parse would
+        for node in buffer.nodes:
+            self.nodes[node.id] = self.nodes.pop(node.id)
+            self._reorder_titled_node(node)
+            self.frames.pop(node.id, None)
+        for node in buffer.nodes:
+            self._add_node_frames(node)
+            node.is_dynamic = False
+        self.run_hook('on_buffer_added', buffer)
+        self._mark_dynamic_nodes()
+        return buffer
+
     def _verify_links_globally(self):
         links = self.get_all_links()
         for filename in links:
@@ -334,7 +488,7 @@ class UrtextProject:
         for old_id in list(changed_ids.keys()):
             new_id = changed_ids[old_id]
             if new_id in self.nodes:
-                for project_node in [n for n in self.nodes.values() if not n.is_dynamic]:
+                for project_node in self.get_links_to(old_id, include_dynamic=False):
                     links_to_change = {}
                     for link in project_node.links:
                         if link.node_id == old_id:
@@ -367,16 +521,24 @@ class UrtextProject:
         if duplicate_titled_nodes:
             for d in duplicate_titled_nodes:
                 old_id = d.id
-                resolution = d.resolve_id(existing_nodes=self.nodes.values())
+                resolution = d.resolve_id(
+                    existing_nodes=self.nodes.values(),
+                    existing_ids=self.nodes)
                 if resolution is False:
                     return False
                 del self.nodes[old_id]
                 self.nodes[resolution] = d
+                self._reorder_titled_node(d)
+                # its orderings are by ID
+                self.metadata_index.add_node(d)
                 if old_id in self.project_settings_nodes:
                     self.project_settings_nodes.remove(old_id)
                     self.project_settings_nodes.append(resolution)
+                    self._settings_changed()
                 self.run_hook('on_node_id_changed', self, old_id, resolution)
-            resolution = node.resolve_id(existing_nodes=self.nodes.values())            
+            resolution = node.resolve_id(
+                existing_nodes=self.nodes.values(),
+                existing_ids=self.nodes)
             if resolution is False or node.id in self.nodes:
                 return False
         return True
@@ -426,12 +588,22 @@ class UrtextProject:
    
         new_node.project = self
         self.nodes[new_node.id] = new_node
+        self.titled_nodes.setdefault(new_node.title, {})[new_node] = None
+        self.metadata_index.add_node(new_node)
+        self.link_graph.add_node(new_node)
+        self.contents_index.add_node(new_node)
+        if self.initialized:
+            # the first _compile() runs every frame regardless
+            self.frame_dependencies.node_added(new_node)
         if new_node.title == 'project_settings':
             self.project_settings_nodes.append(new_node.id)
+            self._settings_changed()
             self.on_project_settings_found()
         self.run_hook('on_node_added', new_node)
 
     def on_project_settings_found(self):
+        for ts_format in self.get_setting_as_text('timestamp_format'):
+            add_timestamp_format(ts_format)
         on_loaded_setting = self.get_setting_as_text('on_loaded')
         for action in on_loaded_setting:
             if action == 'open_home' and self.title() != 'Urtext Base Project' and not self.project_list.node_has_been_opened():
@@ -455,15 +627,26 @@ class UrtextProject:
     def _set_node_contents(self, node_id, contents, preserve_title=False, buffer=None):
         """ project-aware alias for the Node _set_contents() method """
         if buffer:
-            for node in buffer.nodes:
-                if node.id == node_id:
-                    node._set_contents(contents, preserve_title=preserve_title)
-                    return node.buffer
+            node = self._get_buffer_node(buffer, node_id)
+            if node and buffer.overlaps_batched_edit(node):
+                buffer.apply_batched_edits()
+                node = self._get_buffer_node(buffer, node_id)
+            if node:
+                node._set_contents(contents, preserve_title=preserve_title)
+                return node.buffer
         node = self.get_node(node_id)
         if node:
+            if node.buffer.overlaps_batched_edit(node):
+                node.buffer.apply_batched_edits()
+                node = self._get_buffer_node(node.buffer, node_id) or node
             node._set_contents(contents, preserve_title=preserve_title)
             return node.file
 
+    def _get_buffer_node(self, buffer, node_id):
+        for node in buffer.nodes:
+            if node.id == node_id:
+                return node
+
     def _mark_dynamic_nodes(self):
         for frame in self._get_all_frames():
             for node_id in frame.target_ids():
@@ -493,12 +676,23 @@ class UrtextProject:
         self._remove_dynamic_metadata_entries(node.id)
         if node.id in self.project_settings_nodes:
             self.project_settings_nodes.remove(node.id)
+            self._settings_changed()
         self._remove_sub_tags(node.id)
         if node.id in self.frames:
             del self.frames[node.id]
         self.run_hook('on_node_dropped', node)
         if node.id in self.nodes:
             del self.nodes[node.id]
+        titled_nodes = self.titled_nodes.get(node.title, {})
+        titled_nodes.pop(node, None)
+        if not titled_nodes:
+            self.titled_nodes.pop(node.title, None)
+        self.metadata_index.remove_node(node)
+        self.link_graph.remove_node(node)
+        self.contents_index.remove_node(node)
+        if self.initialized:
+            self.frame_dependencies.node_dropped(node)
+        node.drop_derived_contents()
         del node
 
     def delete_file(self, filename):
@@ -668,12 +862,19 @@ class UrtextProject:
         for target_id in source_node.target_nodes:
             if target_id in self.nodes:
                 self.nodes[target_id].metadata.clear_from_source(source_node)
+                self._node_metadata_changed(self.nodes[target_id])
+
+    def _node_metadata_changed(self, node):
+        self.metadata_index.add_node(node)
+        self.frame_dependencies.metadata_changed(node)
+        if node.id in self.project_settings_nodes:
+            self._settings_changed()
 
     def open_node(self, node_id, position=None):
         if not self.compiled:
             self._open_node(node_id, position=position)
         else:
-            self.project_list.execute(self._open_node, node_id, position=position)
+            self.project_list.execute_in_project(self, self._open_node, node_id, position=position)
 
     def preview_node(self, node_id, position=None):
         filename, position =self.get_file_and_position(node_id)
@@ -732,7 +933,7 @@ class UrtextProject:
 
     def sort_for_node_browser(self, nodes=None):
         if not nodes:
-            nodes = list(self.nodes.values())
+            nodes = None
         return self._sort_nodes(nodes, self.get_setting_as_text('node_browser_sort'), reverse=True)
 
     def sort_for_meta_browser(self, nodes):
@@ -747,29 +948,49 @@ class UrtextProject:
         return nodes
 
     def _sort_nodes(self, nodes, keys, reverse=False):
-        remaining_nodes = nodes
+        """
+        Groups nodes by the first of keys they have a value for, each
+        group sorted by that value's timestamp or text, then by ID.
+        Nodes with none of the keys follow in their given order.
+        With nodes None, sorts all of the project's nodes from the
+        metadata index's orderings.
+        """
+        if nodes is None:
+            remaining_nodes = list(self.nodes.values())
+        else:
+            remaining_nodes = nodes
         sorted_nodes = []
+        placed_nodes = set()
         use_timestamp_setting = self.get_setting_as_text('use_timestamp')
         detail_key = self.get_single_setting('node_browser_detail').text
         for k in keys:
             use_timestamp = k in use_timestamp_setting
-            node_group = [r for r in remaining_nodes if r.metadata.get_first_value(k) is not None]
-            remaining_nodes = [r for r in remaining_nodes if r not in node_group]
+            if nodes is None:
+                node_group = [
+                    n for n in self.metadata_index.get_ordering(k, use_timestamp)
+                    if n not in placed_nodes and self.nodes.get(n.id) is n]
+                if reverse:
+                    node_group.reverse()
+            else:
+                first_values = {}
+                for n in remaining_nodes:
+                    if n not in placed_nodes:
+                        value = n.metadata.get_first_value(k)
+                        if value is not None:
+                            first_values[n] = value
+                node_group = sorted(
+                    first_values,
+                    key=lambda n: (get_sort_key(first_values[n], use_timestamp), n.id),
+                    reverse=reverse)
             if node_group:
-                if use_timestamp:
-                    node_group = sorted(
-                        node_group,
-                        key=lambda node: node.metadata.get_first_value(k).timestamp if node.metadata.get_first_value(
-                            k) else None,
-                        reverse=reverse)
+                if not detail_key:
+                    detail_key = k
+                if nodes is None:
+                    detail_values = self.metadata_index.get_first_values(detail_key)
                 else:
-                    node_group = sorted(
-                        node_group,
-                        key=lambda n: n.metadata.get_first_value(k), reverse=reverse)
+                    detail_values = {n: n.metadata.get_first_value(detail_key) for n in node_group}
                 for node in node_group:
-                    if not detail_key:
-                        detail_key = k
-                    detail = node.metadata.get_first_value(detail_key)
+                    detail = detail_values.get(node)
                     if detail:
                         if detail_key in use_timestamp_setting:
                             detail = detail.timestamp.wrapped_string
@@ -779,33 +1000,35 @@ class UrtextProject:
                         detail = ''
                     node.display_detail = detail
                 sorted_nodes.extend(node_group)
-        sorted_nodes.extend([r for r in remaining_nodes if r not in sorted_nodes])
+                placed_nodes.update(node_group)
+        sorted_nodes.extend([r for r in remaining_nodes if r not in placed_nodes])
         return sorted_nodes
 
     def get_node_from_position(self, filename, position, identifier=None):
         if identifier and identifier in self.buffers:
             return self.buffers[identifier].get_node_from_position(position)
         if filename in self.files:
-            node_id = None
-            for node in self.files[filename].nodes:
-                for r in node.ranges:
-                    if position in range(r[0], r[1] + 1):  # +1 in case the cursor is in the last position of the node.
-                        return node
+            return self.files[filename].get_node_from_position(position)
 
     def get_node(self, node_id):
         if node_id in self.nodes:
             return self.nodes[node_id]
 
     def get_links_to(self, to_id, include_dynamic=True):
-        links_to = [n for n in self.nodes.values() if to_id in n.links_ids()]
+        self.frame_dependencies.record_links_to(to_id)
+        links_to = [n for n in self.link_graph.get_links_to(to_id) if self.nodes.get(n.id) is n]
         if not include_dynamic:
             links_to = [n for n in links_to if not n.is_dynamic]
         return links_to
 
     def get_links_from(self, from_id, include_dynamic=True):
+        self.frame_dependencies.record_node(from_id)
+        self.frame_dependencies.record_links_from(from_id)
         from_node = self.get_node(from_id)
         if from_node:
             links = from_node.links_ids()
+            for node_id in links:
+                self.frame_dependencies.record_node(node_id)
             links_from = [l for l in links if l in self.nodes]
             if not include_dynamic:
                 links_from = [link for link in links_from if not self.nodes[link].is_dynamic]
@@ -820,7 +1043,14 @@ class UrtextProject:
         return links
 
     def _find_duplicate_titles(self, node):
-        return [n for n in self.nodes.values() if n.title == node.title]
+        return [n for n in self.titled_nodes.get(node.title, ())
+            if self.nodes.get(n.id) is n]
+
+    def _reorder_titled_node(self, node):
+        """ keeps titled_nodes in the order of self.nodes after the node is moved to the end """
+        titled_nodes = self.titled_nodes.setdefault(node.title, {})
+        titled_nodes.pop(node, None)
+        titled_nodes[node] = None
 
     def log_item(self, filename, message):
         self.messages.setdefault(filename, [])
@@ -839,7 +1069,7 @@ class UrtextProject:
             date = datetime.datetime.now(datetime.timezone.utc).astimezone()
         ts_format_setting = self.get_single_setting('timestamp_format')
         if ts_format_setting: ts_format = ts_format_setting.text
-        else: ts_format = '%a., %b. %d, %Y, %I:%M %p %Z'
+        else: ts_format = default_timestamp_format
         timestamp = UrtextTimestamp(date.strftime(ts_format))
         if ensure_unique:
             while timestamp.unwrapped_string in existing_resolutions:
@@ -902,6 +1132,8 @@ class UrtextProject:
         included_files = self._get_included_files()
         if self.compiled and filename in included_files:
             self._compile_file(filename, flags=['-on_modified'] + flags)    
+            if self.project_list and self.project_list.is_modified_again(filename):
+                return
         self.close_inactive()
         self._sync_file_list()
 
@@ -917,10 +1149,58 @@ class UrtextProject:
         return self.on_modified(filename, flags=['-file_visited'])
 
     def _sync_file_list(self):
+        self._update_file_watcher()
         self._add_paths_from_settings()
         self._verify_paths_from_settings()
         self._drop_missing_files()
 
+    def _update_file_watcher(self):
+        """ starts or stops the file watcher as watch_files is set """
+        if self.setting_is_true('watch_files'):
+            if not self.file_watcher:
+                self.file_watcher = UrtextFileWatcher(on_events=self._on_file_events)
+                self._get_included_files()
+        elif self.file_watcher:
+            file_watcher = self.file_watcher
+            self.file_watcher = None
+            file_watcher.stop()
+
+    def _on_file_events(self):
+        """
+        Called from the file watcher when changes are queued. If the
+        project list is not async, they wait for its next on_modified().
+        """
+        if self.project_list.is_async:
+            self.project_list.execute_in_background(self, self._handle_file_events)
+
+    def _handle_file_events(self):
+        """
+        Compiles the files the file watcher saw added, or written
+        outside of the project and the editor, and drops the ones
+        removed. Files open in the editor are compiled by on_modified().
+        """
+        if not self.file_watcher:
+            return
+        included_files = self._get_included_files()
+        filenames = self.file_watcher.take_events()
+        if not filenames:
+            return
+        open_files = self.run_editor_method('get_open_files') or {}
+        for filename in filenames:
+            if filename not in included_files:
+                continue
+            if filename in self.files:
+                if filename in open_files:
+                    continue
+                buffer = self.files[filename]
+                if buffer.contents == buffer._read_contents():
+                    continue
+            self._compile_file(filename, flags=['-file_watcher'])
+        if [f for f in filenames if f in self.files and f not in included_files]:
+            self.frame_dependencies.take_changes()
+            self._drop_missing_files()
+            self._run_dependent_frames(None, flags=['-file_watcher'])
+
     def _drop_missing_files(self):
         included_files = self._get_included_files()
         for filename in [f for f in list(self.files) if f not in included_files]:
@@ -930,6 +1210,9 @@ class UrtextProject:
             self.drop_buffer(self.files[filename])
 
     def _get_included_files(self):
+        if self.file_watcher:
+            files = self.file_watcher.list_files(self.paths)
+            return [f for f in files if self._include_file(f)]
         files = []
         for pathname in self.paths:
             if os.path.isdir(pathname):
@@ -939,12 +1222,47 @@ class UrtextProject:
         return [f for f in files if self._include_file(f)]
 
     def get_settings_paths(self):
+        """
+        Paths are cached until the paths settings change or a
+        directory they were found in gains or loses a subfolder.
+        """
+        path_settings = self._get_path_settings()
+        # also called from the project list on the editor's thread
+        with self.settings_paths_lock:
+            cache = self.settings_paths_cache
+            if cache and cache['path_settings'] == path_settings and (
+                    cache['entry_path'] == self.entry_path) and (
+                    self._settings_paths_are_current(cache)):
+                return list(cache['paths'])
+            return self._find_settings_paths(path_settings)
+
+    def _find_settings_paths(self, path_settings):
+        """ call with settings_paths_lock held """
         paths = []
+        existing = {}
+        directories = {}
         if self.entry_path is not None:
             paths.append(os.path.abspath(self.entry_path))
-        if os.path.isdir(self.entry_point):
+        existing[self.entry_point] = os.path.isdir(self.entry_point)
+        if existing[self.entry_point]:
             paths.append(os.path.abspath(self.entry_point))
-
+        for path, recurse_subfolders in path_settings:
+            existing[path] = os.path.exists(path)
+            if existing[path]:
+                paths.append(path)
+                if recurse_subfolders:
+                    self._walk_directories(path, paths, directories)
+        self.settings_paths_cache = {
+            'path_settings': path_settings,
+            'entry_path': self.entry_path,
+            'paths': paths,
+            'existing': existing,
+            'directories': directories,
+            }
+        return list(paths)
+
+    def _get_path_settings(self):
+        path_settings = []
         for value in self.get_setting('paths'):
             node_as_value = value.node()
             for n in node_as_value.children:
@@ -954,16 +1272,52 @@ class UrtextProject:
                     path = os.path.abspath(os.path.join(
                         os.path.dirname(n.filename), 
                         path))
-                    if os.path.exists(path):
-                        paths.append(path)
-                        recurse_subfolders = n.metadata.get_first_value('recurse_subfolders')
-                        if recurse_subfolders:                        
-                            if path:
-                                for dirpath, dirnames, filenames in os.walk(path):
-                                    if '/.git' in dirpath or '/_diff' in dirpath:
-                                        continue
-                                    paths.append(os.path.abspath(dirpath))
-        return paths
+                    recurse_subfolders = n.metadata.get_first_value('recurse_subfolders')
+                    path_settings.append((path, bool(recurse_subfolders)))
+        return path_settings
+
+    def _walk_directories(self, path, paths, directories):
+        """
+        Adds path and its subfolders to paths, top down in the same
+        order as os.walk(), recording each one's mtime and subfolders
+        in directories.
+        """
+        if '/.git' in path or '/_diff' in path:
+            return
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                subfolders = [e.name for e in entries if self._is_subfolder(e)]
+        except OSError:
+            return
+        paths.append(os.path.abspath(path))
+        directories[path] = (mtime_ns, subfolders)
+        for name in subfolders:
+            self._walk_directories(os.path.join(path, name), paths, directories)
+
+    def _is_subfolder(self, entry):
+        try:
+            return entry.is_dir() and not entry.is_symlink()
+        except OSError:
+            return False
+
+    def _settings_paths_are_current(self, cache):
+        for path, exists in cache['existing'].items():
+            if exists != (os.path.isdir(path) if path == self.entry_point else os.path.exists(path)):
+                return False
+        for path, (mtime_ns, subfolders) in cache['directories'].items():
+            try:
+                current_mtime_ns = os.stat(path).st_mtime_ns
+                if current_mtime_ns == mtime_ns:
+                    continue
+                # files were added or removed; relist only for subfolders
+                with os.scandir(path) as entries:
+                    if [e.name for e in entries if self._is_subfolder(e)] != subfolders:
+                        return False
+            except OSError:
+                return False
+            cache['directories'][path] = (current_mtime_ns, subfolders)
+        return True
 
     def _include_file(self, filename):
         if filename in self.excluded_files:
@@ -1003,6 +1357,9 @@ class UrtextProject:
              ''.join(self.nodes[n].link()))
             for n in list(self.nodes)]
 
+    async def title_completions_async(self):
+        return await utils.run_async(self.title_completions)
+
     def get_keys_with_frequency(self):
         key_occurrences = {}
         exclude = self.get_setting_as_text('exclude_from_star')
@@ -1058,85 +1415,127 @@ class UrtextProject:
                 return self.visit_node(frame.source_node.id)
         self.handle_info_message('No frame for "%s"' % target_id)
 
+    async def get_by_meta_async(self, key, values, operator):
+        return await utils.run_async(self.get_by_meta, key, values, operator)
+
     def get_by_meta(self, key, values, operator):
+        clause = self._make_query_clause(key, values, operator)
+        return list(clause.get_nodes())
+
+    def query(self, expression):
+        """
+        Yields the IDs of the nodes matching expression, which is a
+        (key, value, operator) clause as get_by_meta() takes, or
+        ('and', [expressions]), ('or', [expressions]) or
+        ('not', expression).
+
+        Clauses are planned from the indexes, so that the most
+        selective one in an 'and' gives the candidates and the others
+        only test them. The IDs should be taken before the project
+        changes.
+        """
+        for node in plan_query(self, expression).get_nodes():
+            yield node.id
 
+    def _make_query_clause(self, key, values, operator):
+        """
+        Records what the clause depends on and returns a QueryClause
+        for the nodes it matches.
+        """
         if not isinstance(values, list):
             values = [values]
-        results = set()
 
-        if operator in ['before', 'after']:
-            compare_date = date_from_timestamp(values[0][1:-1])
-
-            if compare_date:
-                if operator == 'before':
-                    results = [n for n in self.nodes.values() if
-                               default_date != n.metadata.get_date(key) < compare_date]
-                if operator == 'after':
-                    results = [n for n in self.nodes.values() if
-                               n.metadata.get_date(key) > compare_date != default_date]
+        if operator in ['before', 'after', 'between']:
+            self.frame_dependencies.record_key(key)
+            compare_dates = [
+                date_from_timestamp(t.group()[1:-1]) for t in syntax.timestamp_c.finditer(values[0])]
+            if None not in compare_dates:
+                after = before = None
+                if operator == 'before' and len(compare_dates) > 0:
+                    before = compare_dates[0]
+                if operator == 'after' and len(compare_dates) > 0:
+                    after = compare_dates[0]
+                if operator == 'between' and len(compare_dates) > 1:
+                    after, before = sorted(compare_dates[:2])
+                if after or before:
+                    return QueryClause(self, [set(
+                        self.metadata_index.get_nodes_by_date(key, after=after, before=before))])
+            return QueryClause(self)
 
         if key == '_contents' and operator == '?':
-            for node in list(self.nodes.values()):
-                if node.is_dynamic:
-                    continue
-                contents = node.stripped_contents
-                lower_contents = contents.lower()
+            self.frame_dependencies.record_all_contents()
+            if not self.contents_index.enabled:
+                self.contents_index.build(list(self.nodes.values()))
+            node_contents = self.contents_index.node_contents
+            lowered_values = [v.lower() for v in values]
+
+            def contains_values(node):
+                contents = node_contents.get(node)
+                if contents is None or node.is_dynamic:
+                    return False
+                return any(v in contents for v in lowered_values)
 
-                for v in values:
-                    if v.lower() in lower_contents:
-                        results.add(node.id)
+            def search_contents():
+                return [n for v in values
+                    for n in self.contents_index.search(v) if not n.is_dynamic]
+
+            return QueryClause(self, test=contains_values, search=search_contents)
 
-        elif key == '_links_to':
-            for v in values:
-                results.update(self.get_links_to(v))
+        if key == '_links_to':
+            return QueryClause(self, [set(self.get_links_to(v)) for v in values])
 
-        elif key == '_links_from':
-            for v in values:
-                results.update(self.get_links_from(v))
+        if key == '_links_from':
+            return QueryClause(self, [set(self.get_links_from(v)) for v in values])
+
+        numerical_keys_setting = self.get_setting_as_text('numerical_keys')
+        case_sensitive_setting = self.get_setting_as_text('case_sensitive_keys')
+        if key == '*':
+            self.frame_dependencies.record_key(key)
+            keys = self.metadata_index.get_keys()
         else:
-            numerical_keys_setting = self.get_setting_as_text('numerical_keys')
-            case_sensitive_setting = self.get_setting_as_text('case_sensitive_keys')
-            if key == '*':
-                keys = self.get_all_keys()
-            else:
-                keys = [key]
-            for k in keys:
-                for value in values:
-                    if value == '*':
-                        results.update([n for n in self.nodes if self.nodes[n].metadata.get_values(k)])
-                        continue
-                    if k in numerical_keys_setting:
-                        try:
-                            value = float(value)
-                        except ValueError:
-                            value = float('inf')
-
-                    use_timestamp = False
-                    if isinstance(value, UrtextTimestamp):
-                        use_timestamp = True
-
-                    if k in case_sensitive_setting:
-                        results.update([
-                            n for n in self.nodes if
-                            value in [
-                                v.text for v in self.nodes[n].metadata.get_values(k) if v.text]])
-                    else:
-                        if isinstance(value, str):
-                            value = value.lower()
-                        for n in list(self.nodes.values()):
-                            found_values = n.metadata.get_values(k)
-                            if use_timestamp:
-                                if value in [v.timestamp for v in found_values]:
-                                    results.update([n.id])
-                            elif k in numerical_keys_setting:
-                                if value in [v.num() for v in found_values]:
-                                    results.update([n.id])                              
-                            else:
-                                if value in [v.text_lower for v in found_values]:
-                                    results.update([n.id])
-
-        results = list(results)
-        return [self.nodes[n] for n in results]
+            keys = [key]
+        sources = []
+        timestamps = []
+        for k in keys:
+            for value in values:
+                if value == '*':
+                    self.frame_dependencies.record_key(k)
+                    sources.append(self._get_indexed_nodes(k, '*'))
+                    continue
+                if isinstance(value, str) and k not in numerical_keys_setting:
+                    self.frame_dependencies.record_value(k, value)
+                else:
+                    self.frame_dependencies.record_key(k)
+                if k in numerical_keys_setting:
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        value = float('inf')
+
+                if k in case_sensitive_setting:
+                    sources.append(self._get_indexed_nodes(k, 'text', value))
+                elif isinstance(value, UrtextTimestamp):
+                    timestamps.append((k, value))
+                elif k in numerical_keys_setting:
+                    sources.append(self._get_indexed_nodes(k, 'num', value))
+                else:
+                    if isinstance(value, str):
+                        value = value.lower()
+                    sources.append(self._get_indexed_nodes(k, 'lower', value))
+
+        def has_timestamps(node):
+            for k, value in timestamps:
+                if value in [v.timestamp for v in node.metadata.get_values(k)]:
+                    return True
+            return False
+
+        return QueryClause(self, sources, test=has_timestamps if timestamps else None)
+
+    def _get_indexed_nodes(self, keyname, form, value=None):
+        try:
+            return self.metadata_index.get_nodes(keyname, form, value)
+        except TypeError: # unhashable value
+            return set()
 
     def get_file_and_position(self, node_id):
         if node_id in self.nodes:
@@ -1171,12 +1570,28 @@ class UrtextProject:
         num_project_calls = len(list(self.project_instance_calls.keys()))
         modified_buffers = set()
         dynamic_nodes = set()
+        self.frame_dependencies.take_changes()
+        for buffer in list(self.files.values()):
+            buffer.begin_batch()
         for frame in self._get_all_frames():
             self._run_frame(frame)
         if len(self.calls.keys()) > num_calls or len(self.project_instance_calls.keys()) > num_project_calls:
             return self._compile()
+        # output is not parsed back into the project here, so take the
+        # targets as changed and run again only the frames affected
         for frame in self._get_all_frames():
-            self._run_frame(frame)
+            if frame.ran:
+                for node_id in frame.target_ids():
+                    self.frame_dependencies.contents_changed(node_id)
+        dependent_frames = self.frame_dependencies.get_dependent_frames(
+            self.frame_dependencies.take_changes())
+        for frame in self._get_all_frames():
+            if frame_key(frame) in dependent_frames or not frame.dependencies_recorded():
+                self._run_frame(frame)
+        for buffer in list(self.files.values()):
+            buffer.end_batch()
+        self.frame_dependencies.remove_frames_except(
+            [frame_key(frame) for frame in self._get_all_frames()])
         self._add_all_sub_tags()
         self._verify_links_globally()
 
@@ -1185,8 +1600,10 @@ class UrtextProject:
             flags = []
         modified_buffers = set()
         dynamic_nodes = set()
+        self.frame_dependencies.take_changes()
         buffer = self._parse_file(filename)
         if buffer:
+            buffer.begin_batch()
             for node in buffer.nodes:
                 frames = self._get_frames(target_node=node)
                 for frame in frames:
@@ -1194,20 +1611,83 @@ class UrtextProject:
                     modified_buffers.update(m_buffers)
                     dynamic_nodes.update(d_nodes)
             modified_buffers.add(buffer)
-            for b in modified_buffers:
-                for node in b.nodes:
-                    self._verify_frame_present_if_marked(node.id, buffer=b)
-            for b in list(modified_buffers):
-                verified_links_content = self._reverify_links(b.filename, buffer=b)
-                b.set_buffer_contents(verified_links_content)
-                b.write_buffer_contents(run_hook=True)
-            for d in list(dynamic_nodes):
-                node = self.get_node(d)
-                if node:
-                    node.is_dynamic = True
+            self._write_modified_buffers(modified_buffers, dynamic_nodes)
+            self._run_dependent_frames(filename, flags=flags)
         if filename in self.files:
             self.run_hook('after_on_file_modified', filename)  
 
+    def _write_modified_buffers(self, modified_buffers, dynamic_nodes):
+        """ applies the edits batched in each buffer and writes it once """
+        for b in modified_buffers:
+            b.apply_batched_edits()
+            b.begin_batch()
+            for node in b.nodes:
+                self._verify_frame_present_if_marked(node.id, buffer=b)
+            b.end_batch()
+        for b in list(modified_buffers):
+            verified_links_content = self._reverify_links(b.filename, buffer=b)
+            b.set_buffer_contents(verified_links_content)
+            b.write_buffer_contents(run_hook=True)
+        for d in list(dynamic_nodes):
+            node = self.get_node(d)
+            if node:
+                node.is_dynamic = True
+
+    def _run_dependent_frames(self, filename, flags=None):
+        """
+        After a file is compiled, runs once each frame elsewhere in the
+        project depending on what changed, and frames defined in the file
+        that have not run yet. Their output is batched in the target
+        buffers, each written once at the end.
+        """
+        dependent_frames = self.frame_dependencies.get_dependent_frames(
+            self.frame_dependencies.take_changes())
+        file_node_ids = []
+        if filename in self.files:
+            file_node_ids = [n.id for n in self.files[filename].nodes]
+        frame_keys = {}
+        for frame in self._get_all_frames():
+            if frame.is_manual():
+                continue
+            if [i for i in frame.target_ids() if i in file_node_ids]:
+                continue
+            key = frame_key(frame)
+            if key in dependent_frames or (
+                    not frame.ran and frame.source_node.id in file_node_ids):
+                frame_keys[key] = None
+        frames = [f for f in self._get_all_frames() if frame_key(f) in frame_keys]
+        # frames write through the project's nodes, which must
+        # match the buffers being written to
+        for frame in frames:
+            for node_id in frame.target_ids() + [frame.source_node.id]:
+                self._sync_buffer(self.get_node(node_id))
+        frames = [f for f in self._get_all_frames() if frame_key(f) in frame_keys]
+        batched_buffers = set()
+        for frame in frames:
+            for node_id in frame.target_ids() + [frame.source_node.id]:
+                node = self.get_node(node_id)
+                if node:
+                    node.buffer.begin_batch()
+                    batched_buffers.add(node.buffer)
+        modified_buffers = set()
+        dynamic_nodes = set()
+        for frame in frames:
+            m_buffers, d_nodes = self._run_frame(frame, flags=flags)
+            modified_buffers.update([b for b in m_buffers if isinstance(b, UrtextBuffer)])
+            dynamic_nodes.update(d_nodes)
+        for b in batched_buffers - modified_buffers:
+            b.end_batch()
+        self._write_modified_buffers(modified_buffers, dynamic_nodes)
+        self.frame_dependencies.take_changes()
+
+    def _sync_buffer(self, node):
+        if not node or node.filename not in self.files:
+            return
+        for n in self.files[node.filename].nodes:
+            if self.nodes.get(n.id) is not n:
+                self._parse_file(node.filename)
+                return
+
     def _run_frame(self, frame, flags=None, buffer=None):
         if flags is None:
             flags = []
@@ -1215,7 +1695,11 @@ class UrtextProject:
         dynamic_nodes = []
         if frame.is_manual():
             return []
-        output = frame.process(flags=flags)
+        self.frame_dependencies.start_frame(frame)
+        try:
+            output = frame.process(flags=flags)
+        finally:
+            self.frame_dependencies.end_frame()
         for target in frame.targets:
             if output not in [False, None]:
                 if target.is_node and not self.get_node(target.node_id) or (
@@ -1306,6 +1790,7 @@ class UrtextProject:
                     tag_self=True,
                     from_node=entry.from_node,
                     tag_descendants=entry.tag_descendants)
+                self._node_metadata_changed(self.nodes[node_to_tag])
                 if node_to_tag not in entry.from_node.target_nodes:
                     entry.from_node.target_nodes.append(node_to_tag)
 
@@ -1353,16 +1838,10 @@ class UrtextProject:
     def editor_copy_link_to_node(self, position, filename, include_project=False):
 
         self._parse_file(filename)
-        if filename in self.files:
-            node_id = None
-            for node in self.files[filename].nodes:
-                for r in node.ranges:
-                    if position in range(r[0], r[1] + 1):  # +1 in case the cursor is in the last position of the node.
-                        node_id = node.id
-                        break
-            if node_id:
-                link = self.project_list.build_contextual_link(node_id, include_project=include_project)
-                return self.run_editor_method('set_clipboard', link)
+        node = self.get_node_from_position(filename, position)
+        if node:
+            link = self.project_list.build_contextual_link(node.id, include_project=include_project)
+            return self.run_editor_method('set_clipboard', link)
         self.handle_info_message('No Node found here')
 
     def run_editor_method(self, method_name, *args, **kwargs):
@@ -1420,7 +1899,10 @@ class UrtextProject:
             self.handle_info_message('call %s is not available' % call_name)
             return None
         op = call(self)
-        return self.project_list.execute(op.run, *args, **kwargs)
+        return self.project_list.execute_in_project(self, op.run, *args, **kwargs)
+
+    async def run_call_async(self, call_name, *args, **kwargs):
+        return await utils.run_async(self.run_call, call_name, *args, **kwargs)
 
     def add_action(self, action):
         propagated_actions = self.get_setting_as_text('propagate_actions')
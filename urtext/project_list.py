@@ -1,7 +1,7 @@
 import os
-import concurrent.futures
 import sys
 import shutil
+import threading
 
 if os.path.exists(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sublime.txt')):
     sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '../vendor'))
@@ -9,6 +9,7 @@ if os.path.exists(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'sub
 
 from urtext.project import UrtextProject
 from urtext.call import UrtextCall
+from urtext.scheduler import UrtextScheduler
 import urtext.syntax as syntax
 import urtext.utils as utils
 
@@ -27,7 +28,12 @@ class ProjectList:
 
         self.is_async = is_async
         #self.is_async = False  # development
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.scheduler = UrtextScheduler(max_workers=4)
+        self.modified_lock = threading.Lock()
+        self.queued_modifications = {}
+        self.on_modified_queued = 0
+        self.on_modified_coalesced = 0
+        self.on_modified_superseded = 0
         self.editor_methods = editor_methods if editor_methods else {}
         self.entry_point = entry_point.strip()
         self.calls = {}
@@ -35,6 +41,10 @@ class ProjectList:
         self.project_instance_calls = {}
         self.project_list_instance_calls = {}
         self.projects = []
+        self.project_paths = {}
+        self.project_paths_lock = threading.Lock()
+        self.settings_generation = 0
+        self.settings_lock = threading.Lock()
         self.entry_points = []
         self.current_project = None
         self.node_opened = False
@@ -51,7 +61,21 @@ class ProjectList:
         visible=True,
         make_current=False,
         action=None):
-        self.execute(self._init_project, entry_point, new_file_node_created=new_file_node_created, initial=initial, make_current=make_current, visible=visible, action=action)
+        # projects initialize in order, since settings propagate from
+        # the projects before them
+        return self._schedule(
+            [entry_point, '_initialize'],
+            False,
+            self._init_project,
+            entry_point,
+            new_file_node_created=new_file_node_created,
+            initial=initial,
+            make_current=make_current,
+            visible=visible,
+            action=action)
+
+    async def init_project_async(self, entry_point, **kwargs):
+        return await utils.run_async(self.init_project, entry_point, **kwargs)
 
     def _init_project(self,
         entry_point,
@@ -80,10 +104,29 @@ class ProjectList:
                 self.run_action(action)
         else:
             self.projects.remove(project)
+            self.clear_settings_caches()
 
     def execute(self, function, *args, **kwargs):
+        """ runs alone, after everything already submitted """
+        return self._schedule(None, True, function, *args, **kwargs)
+
+    def execute_in_project(self, project, function, *args, **kwargs):
+        """
+        Runs after what was submitted before for the same project,
+        possibly alongside work in other projects. Until a project
+        has compiled, its work runs alone.
+        """
+        keys = [project.entry_point] if project.compiled else None
+        return self._schedule(keys, True, function, *args, **kwargs)
+
+    def execute_in_background(self, project, function, *args, **kwargs):
+        """ as execute_in_project, but behind interactive work """
+        keys = [project.entry_point] if project.compiled else None
+        return self._schedule(keys, False, function, *args, **kwargs)
+
+    def _schedule(self, keys, interactive, function, *args, **kwargs):
         if self.is_async:
-            return self.executor.submit(function, *args, **kwargs)
+            return self.scheduler.submit(keys, interactive, function, *args, **kwargs)
         return function(*args, **kwargs)
     
     def get_setting(self, setting, calling_project):
@@ -94,6 +137,24 @@ class ProjectList:
                     return values
         return []
 
+    def cache_setting(self, project, cache_key, values, generation):
+        """ caches values in project if no settings changed since generation """
+        with self.settings_lock:
+            if generation == self.settings_generation:
+                project.settings_cache[cache_key] = values
+
+    def clear_settings_caches(self):
+        """
+        Settings may be propagated from any project to the others.
+        Values found before the generation changed are not cached.
+        """
+        with self.settings_lock:
+            self.settings_generation += 1
+            for project in self.projects:
+                project.settings_cache.clear()
+        with self.project_paths_lock:
+            self.project_paths = {}
+
     def _get_project_from_buffer(self, buffer_id):
         for project in self.projects:
             if buffer_id in project.buffers:
@@ -129,6 +190,15 @@ class ProjectList:
         link.filename = filename
         link.click()
 
+    async def handle_link_async(self, string, filename, file_pos, col_pos=0, identifier=None):
+        return await utils.run_async(
+            self.handle_link,
+            string,
+            filename,
+            file_pos,
+            col_pos=col_pos,
+            identifier=identifier)
+
     def handle_unusable_link(self):
         if self.current_project and not self.current_project.compiled:
             message = "Project is still compiling"
@@ -137,9 +207,52 @@ class ProjectList:
         return self.run_editor_method('info_message', message)
 
     def on_modified(self, filename):
-        return self.execute(self._on_modified, filename)
+        """
+        A save of a file that is already queued is left to the queued
+        job, which has not read the file yet.
+        """
+        if not self.is_async:
+            return self._on_modified(filename)
+        project = self._get_project_from_path(os.path.dirname(filename))
+        with self.modified_lock:
+            if filename in self.queued_modifications:
+                self.on_modified_coalesced += 1
+                return self.queued_modifications[filename]
+            if project:
+                future = self.execute_in_project(project, self._run_queued_modification, filename)
+            else:
+                future = self.execute(self._run_queued_modification, filename)
+            self.queued_modifications[filename] = future
+            self.on_modified_queued += 1
+        return future
+
+    async def on_modified_async(self, filename):
+        return await utils.run_async(self.on_modified, filename)
+
+    def _run_queued_modification(self, filename):
+        with self.modified_lock:
+            del self.queued_modifications[filename]
+        return self._on_modified(filename)
+
+    def is_modified_again(self, filename):
+        """
+        True if a later save of the file is queued, so that the work
+        after compiling it can be left to that save's job.
+        """
+        with self.modified_lock:
+            if filename in self.queued_modifications:
+                self.on_modified_superseded += 1
+                return True
+        return False
+
+    def get_queue_depth(self):
+        return self.scheduler.get_queue_depth()
 
     def _on_modified(self, filename):
+        if not self.is_async:
+            # otherwise each project's file events are scheduled
+            for project in self.projects:
+                project._handle_file_events()
         project = self._get_project_from_path(
             os.path.dirname(filename))
         if project:
@@ -151,9 +264,27 @@ class ProjectList:
     def _get_project_from_path(self, path):
         if not os.path.isdir(path):
             path = os.path.dirname(path)
-        for project in self.projects:
-            if path in project.get_settings_paths():
-                return project
+        return self._lookup_project_path(path)
+
+    def _lookup_project_path(self, path):
+        """
+        Finds the first project whose settings paths include path,
+        from a map of each path to its project. A path not in the
+        map, or whose project no longer includes it, rebuilds the map.
+        Lookups run on the editor's thread and in scheduled jobs, so
+        the map is rebuilt aside and swapped in under the lock.
+        """
+        with self.project_paths_lock:
+            project = self.project_paths.get(path)
+        if project in self.projects and path in project.get_settings_paths():
+            return project
+        project_paths = {}
+        for project in list(self.projects):
+            for project_path in project.get_settings_paths():
+                project_paths.setdefault(project_path, project)
+        with self.project_paths_lock:
+            self.project_paths = project_paths
+        return project_paths.get(path)
 
     def _get_project_from_title(self, title):
         for project in self.projects:
@@ -219,16 +350,16 @@ class ProjectList:
         return project if project else None
 
     def get_current_project(self, path):
-        for project in self.projects:
-            if path in project.get_settings_paths():
-                return project
-        return None
+        return self._lookup_project_path(path)
 
     def visit_file(self, filename):
         self.set_current_project(filename)
         if self.current_project:
             self.notify_node_opened()
-            return self.execute(self.current_project.visit_file, filename)
+            return self.execute_in_project(
+                self.current_project,
+                self.current_project.visit_file,
+                filename)
 
     def move_file(self,
                   old_filename,
@@ -380,6 +511,9 @@ class ProjectList:
             return None
         return call_instance.run(*args, **kwargs)
 
+    async def run_call_async(self, call_name, *args, **kwargs):
+        return await utils.run_async(self.run_call, call_name, *args, **kwargs)
+
     def make_file_link(self, path):
         if path:
             return utils.make_file_link(path)
@@ -407,7 +541,9 @@ class ProjectList:
         if self.current_project and selection in self.current_project.actions:
             if self.current_project.actions[selection].inline_safe:
                 return self.current_project.actions[selection].run()
-            return self.execute(self.current_project.actions[selection].run)
+            return self.execute_in_project(
+                self.current_project,
+                self.current_project.actions[selection].run)
         if selection in self.actions:
             if self.actions[selection].inline_safe:
                 return self.actions[selection].run()
@@ -0,0 +1,149 @@
+class QueryClause:
+    """
+    The nodes matching one key/value/operator clause, as
+    UrtextProject.get_by_meta() finds them: the union of some
+    collections of nodes from the project's indexes, and of the nodes
+    passing test, found by search or else by a scan of the project.
+    """
+
+    def __init__(self, project, sources=None, test=None, search=None):
+        self.project = project
+        self.sources = sources if sources else []
+        self.test = test
+        self.search = search
+
+    def estimate(self):
+        """ the most nodes the clause can match, or None if unknown """
+        if self.test:
+            return None
+        return sum(len(s) for s in self.sources)
+
+    def matches(self, node):
+        for source in self.sources:
+            if node in source:
+                return True
+        return bool(self.test and self.test(node))
+
+    def get_nodes(self):
+        found = set()
+        for source in self.sources:
+            for node in list(source):
+                if node not in found and self.project.nodes.get(node.id) is node:
+                    found.add(node)
+                    yield node
+        if not self.test:
+            return
+        if self.search:
+            nodes = self.search()
+        else:
+            nodes = [n for n in list(self.project.nodes.values()) if self.test(n)]
+        for node in nodes:
+            if node not in found and self.project.nodes.get(node.id) is node:
+                found.add(node)
+                yield node
+
+class AllOf:
+
+    def __init__(self, project, parts):
+        self.project = project
+        self.parts = sorted(parts, key=sort_by_estimate)
+
+    def estimate(self):
+        estimates = [p.estimate() for p in self.parts if p.estimate() is not None]
+        return min(estimates) if estimates else None
+
+    def matches(self, node):
+        return all(p.matches(node) for p in self.parts)
+
+    def get_nodes(self):
+        if not self.parts:
+            yield from AnyNode(self.project).get_nodes()
+            return
+        # the most selective part gives the candidates the rest test
+        first = self.parts[0]
+        if isinstance(first, NoneOf):
+            first = AnyNode(self.project)
+            rest = self.parts
+        else:
+            rest = self.parts[1:]
+        for node in first.get_nodes():
+            if all(p.matches(node) for p in rest):
+                yield node
+
+class AnyOf:
+
+    def __init__(self, project, parts):
+        self.project = project
+        self.parts = sorted(parts, key=sort_by_estimate)
+
+    def estimate(self):
+        estimates = [p.estimate() for p in self.parts]
+        if None in estimates:
+            return None
+        return sum(estimates)
+
+    def matches(self, node):
+        return any(p.matches(node) for p in self.parts)
+
+    def get_nodes(self):
+        found = set()
+        for part in self.parts:
+            for node in part.get_nodes():
+                if node not in found:
+                    found.add(node)
+                    yield node
+
+class NoneOf:
+
+    def __init__(self, project, part):
+        self.project = project
+        self.part = part
+
+    def estimate(self):
+        return None
+
+    def matches(self, node):
+        return not self.part.matches(node)
+
+    def get_nodes(self):
+        for node in AnyNode(self.project).get_nodes():
+            if not self.part.matches(node):
+                yield node
+
+class AnyNode:
+
+    def __init__(self, project):
+        self.project = project
+        project.frame_dependencies.record_all_nodes()
+
+    def estimate(self):
+        return None
+
+    def matches(self, node):
+        return True
+
+    def get_nodes(self):
+        return iter(list(self.project.nodes.values()))
+
+def sort_by_estimate(part):
+    """ known estimates first, smallest first; tests that negate last """
+    estimate = part.estimate()
+    return (isinstance(part, NoneOf), estimate is None, estimate or 0)
+
+def plan_query(project, expression):
+    """
+    Returns the plan for an expression: a (key, value, operator)
+    clause as get_by_meta() takes, or ('and', [expressions]),
+    ('or', [expressions]) or ('not', expression).
+    """
+    if len(expression) == 3:
+        key, values, operator = expression
+        return project._make_query_clause(key, values, operator)
+    operator, operand = expression
+    if operator == 'and':
+        return AllOf(project, [plan_query(project, e) for e in operand])
+    if operator == 'or':
+        return AnyOf(project, [plan_query(project, e) for e in operand])
+    if operator == 'not':
+        return NoneOf(project, plan_query(project, operand))
+    raise ValueError('unknown query operator: %s' % operator)
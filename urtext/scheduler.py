@@ -0,0 +1,97 @@
+import threading
+import concurrent.futures
+
+class UrtextScheduler:
+    """
+    Runs submitted functions on up to max_workers threads.
+
+    Each function is submitted with the keys it needs to itself,
+    usually a project's entry point. Functions sharing a key run one
+    at a time, in the order submitted; other functions may run at the
+    same time. A function submitted with keys=None runs alone, after
+    everything submitted before it and before everything after it.
+    Of the functions that could start, interactive ones start first.
+
+    Threads are started as functions become ready and end when there
+    is nothing left they could start.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.pending = []
+        self.running = []
+        self.workers = 0
+
+    def submit(self, keys, interactive, function, *args, **kwargs):
+        task = UrtextTask(keys, interactive, function, args, kwargs)
+        with self.lock:
+            self.pending.append(task)
+            self._start_workers(len(self._get_startable_tasks()))
+        return task.future
+
+    def get_queue_depth(self):
+        """ returns the number of functions not yet started """
+        with self.lock:
+            return len(self.pending)
+
+    def _get_startable_tasks(self):
+        """ call with the lock held """
+        taken_keys = set()
+        for task in self.running:
+            if task.keys is None:
+                return []
+            taken_keys.update(task.keys)
+        startable = []
+        for index, task in enumerate(self.pending):
+            if task.keys is None:
+                if index == 0 and not self.running:
+                    return [task]
+                break
+            if not taken_keys.intersection(task.keys):
+                startable.append(task)
+            taken_keys.update(task.keys)
+        return sorted(startable, key=lambda t: not t.interactive)
+
+    def _start_workers(self, wanted):
+        """ call with the lock held """
+        waiting_workers = self.workers - len(self.running)
+        for i in range(min(wanted - waiting_workers, self.max_workers - self.workers)):
+            self.workers += 1
+            threading.Thread(target=self._work).start()
+
+    def _work(self):
+        task = None
+        while True:
+            with self.lock:
+                if task:
+                    self.running.remove(task)
+                startable = self._get_startable_tasks()
+                if not startable:
+                    self.workers -= 1
+                    return
+                task = startable[0]
+                self.pending.remove(task)
+                self.running.append(task)
+                self._start_workers(len(startable) - 1)
+            task.run()
+
+class UrtextTask:
+
+    def __init__(self, keys, interactive, function, args, kwargs):
+        self.keys = set(keys) if keys is not None else None
+        self.interactive = interactive
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except BaseException as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(result)
@@ -103,6 +103,7 @@ format_key = r'\$_?[\.A-Za-z0-9_-]*'
 metadata_arg_delimiter = r';|\r'
 metadata_op_before = r'before'
 metadata_op_after = r'after'
+metadata_op_between = r'between'
 metadata_op_equals = r'='
 metadata_op_not_equals = r'!='
 metadata_op_contains = r'\?'
@@ -244,6 +245,7 @@ special_metadata_patterns = r''.join([
 metadata_ops = r'(' + r'|'.join([
             metadata_op_before,
             metadata_op_after,
+            metadata_op_between,
             metadata_op_equals,
             metadata_op_not_equals,
             metadata_op_contains,
@@ -320,6 +322,17 @@ compiled_symbols = {
     re.compile(node_pointer) : 'pointer',
     meta_to_node_c : 'meta_to_node'
     }
+
+# Single-pass lexer: every symbol starts on one of these characters.
+lexer_symbols = r''.join([
+    '[',
+    re.escape(node_opening_wrapper),
+    re.escape(node_closing_wrapper),
+    link_opening_pipe_escaped,
+    ']'])
+lexer_symbols_c = re.compile(lexer_symbols)
+word_character_c = re.compile(r'\w')
+
 embedded_syntax_symbols = {
     re.compile(embedded_syntax_open) : 'embedded_syntax_open', 
     re.compile(embedded_syntax_close) : 'embedded_syntax_close',
@@ -1,12 +1,21 @@
 import datetime
+import functools
+import threading
+import time
+from dateutil import tz
 from dateutil.parser import *
 import urtext.syntax as syntax
 
 default_date = datetime.datetime(1970,1,1, tzinfo=datetime.timezone.utc)
+default_timestamp_format = '%a., %b. %d, %Y, %I:%M %p %Z'
+# replaced, not changed, when a format is added, since other
+# threads may be parsing with it
+timestamp_formats = {}
+timestamp_formats_lock = threading.Lock()
 
 class UrtextTimestamp:
-    def __init__(self, 
-        unwrapped_string, 
+    def __init__(self,
+        unwrapped_string,
         start_position=None):
 
         self.wrapped_string = ''.join([
@@ -25,20 +34,81 @@ class UrtextTimestamp:
     def __lt__(self, other):
         return self.datetime < other.datetime
 
+def add_timestamp_format(ts_format):
+    """
+    Registers a format tried with strptime before falling back
+    to dateutil. Only formats that dateutil reads the same way are
+    used: a full date (dateutil fills in missing fields from the
+    current date) and a named month or month before day.
+    """
+    global timestamp_formats
+    has_tz_name = ts_format.endswith('%Z')
+    if has_tz_name:
+        ts_format = ts_format[:-2].rstrip()
+    if ts_format in timestamp_formats:
+        return
+    if '%Z' in ts_format or '%z' in ts_format or '%y' in ts_format:
+        return
+    if '%Y' not in ts_format or '%d' not in ts_format:
+        return
+    if '%b' not in ts_format and '%B' not in ts_format:
+        if '%m' not in ts_format or ts_format.index('%m') > ts_format.index('%d'):
+            return
+    with timestamp_formats_lock:
+        formats = dict(timestamp_formats)
+        formats[ts_format] = has_tz_name
+        timestamp_formats = formats
 
+@functools.lru_cache(maxsize=4096)
 def date_from_timestamp(datestamp_string):
     if not datestamp_string:
         return default_date
-    d = None
+    d = _parse_with_formats(datestamp_string)
+    if d:
+        return d
     try:
         d = parse(datestamp_string)
     except:
         return None
     if d.tzinfo == None:
         try:
-            d = d.replace(tzinfo=datetime.timezone.utc)    
+            d = d.replace(tzinfo=datetime.timezone.utc)
         except:
             print('cannot add timezone info to')
             print(datestamp_string)
             print(d)
     return d
+
+def _parse_with_formats(datestamp_string):
+    """
+    Returns None when dateutil should parse the string instead.
+    Zone names are resolved the way dateutil resolves them.
+    """
+    for ts_format, has_tz_name in timestamp_formats.items():
+        date_string, tz_name = datestamp_string, None
+        if has_tz_name:
+            date_string, _, tz_name = datestamp_string.rpartition(' ')
+            if not (0 < len(tz_name) <= 5 and tz_name.isascii() and tz_name.isalpha() and tz_name.isupper()):
+                continue
+        try:
+            d = datetime.datetime.strptime(date_string.strip(), ts_format)
+        except ValueError:
+            continue
+        return _add_tz(d, tz_name)
+
+def _add_tz(d, tz_name):
+    utc_names = ['UTC', 'GMT', 'Z']
+    if tz_name and tz_name in time.tzname:
+        d = d.replace(tzinfo=tz.tzlocal())
+        if d.tzname() != tz_name:
+            folded = tz.enfold(d, fold=1)
+            if folded.tzname() == tz_name:
+                d = folded
+        if d.tzname() != tz_name and tz_name in utc_names:
+            d = d.replace(tzinfo=tz.UTC)
+        return d
+    if tz_name in utc_names:
+        return d.replace(tzinfo=tz.UTC)
+    return d.replace(tzinfo=datetime.timezone.utc)
+
+add_timestamp_format(default_timestamp_format)
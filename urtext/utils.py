@@ -3,6 +3,9 @@ from urtext.link import UrtextLink
 from urtext.url import url_match_c
 import urtext.syntax as syntax
 import os
+import asyncio
+import functools
+import concurrent.futures
 
 def strip_backtick_escape(contents):
     ranges = []
@@ -43,6 +46,19 @@ def make_action_link(action_string):
         syntax.link_closing_wrapper     
         ])
 
+async def run_async(function, *args, **kwargs):
+    """
+    Runs function on the event loop's default executor, so that its
+    file reads and writes do not block the loop, and awaits the
+    Future it returns, if any.
+    """
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(
+        None, functools.partial(function, *args, **kwargs))
+    if isinstance(result, concurrent.futures.Future):
+        return await asyncio.wrap_future(result)
+    return result
+
 def write_file_contents(filename, contents):
     with open(filename, 'w', encoding='utf-8' ) as f:
         f.write(contents)
@@ -204,6 +220,30 @@ def get_all_links_from_string(string, node, project_list, include_http=False):
         l.project_list = project_list 
     return links, replaced_contents
 
+def get_edited_range(old_contents, new_contents):
+    """
+    Returns (start, old_end, new_end) such that the contents differ
+    only in old_contents[start:old_end] / new_contents[start:new_end].
+    Prefix and suffix lengths are found by bisecting slice comparisons.
+    """
+    shortest = min(len(old_contents), len(new_contents))
+    low, high = 0, shortest
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old_contents[:middle] == new_contents[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    start = low
+    low, high = 0, shortest - start
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old_contents[len(old_contents) - middle:] == new_contents[len(new_contents) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return start, len(old_contents) - low, len(new_contents) - low
+
 def get_file_extension(filename):
     if len(os.path.splitext(filename)) == 2:
         return os.path.splitext(filename)[1].lstrip('.')